@@ -1,14 +1,134 @@
 from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
-import tempfile
-import io
+from contextlib import asynccontextmanager
 import os
-from chat_bot import chat_bot
-from voice_chat import stt, tts
+import json
+import random
+import asyncio
+from chat_bot import achat_bot, achat_bot_stream
+from voice_chat import astt, speak_stream, MAX_AUDIO_BYTES
+from helpers.database_connector import get_engine, pool_metrics
+from helpers.tool_cache_helper import tool_cache
+from helpers.vehicle_catalog_helper import vehicle_catalog
 
-app = FastAPI()
+# Heavy subsystems start after the server is up, so it accepts connections right away.
+# Each one is retried with backoff until it succeeds. /ready reports 503 until the
+# database is up; the RAG stack is reported separately, as chat works without it.
+startup_state = {"database": False, "rag": False}
+startup_errors = {}
+WARM_UP_MAX_BACKOFF_SECONDS = float(os.getenv("WARM_UP_MAX_BACKOFF_SECONDS", 300))
+
+
+def warm_up_database():
+    # Creates the connection pool and applies pending migrations
+    get_engine()
+    vehicle_catalog.refresh()
+
+
+def warm_up_rag():
+    # Loads the RAG stack and builds or refreshes the vector index
+    from rag import rag_service
+    rag_service.warm_up()
+
+
+async def warm_up(name, start):
+    delay = 1.0
+    while True:
+        try:
+            await asyncio.to_thread(start)
+            startup_state[name] = True
+            startup_errors.pop(name, None)
+            return
+        except Exception as e:
+            print(e)
+            startup_errors[name] = str(e)
+            await asyncio.sleep(delay * (0.5 + random.random()))
+            delay = min(delay * 2, WARM_UP_MAX_BACKOFF_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [
+        asyncio.create_task(warm_up("database", warm_up_database)),
+        asyncio.create_task(warm_up("rag", warm_up_rag)),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+class LimitVoiceUploadSize:
+    """
+    Reject oversized audio before it is spooled, with a 413.
+
+    A too-large Content-Length is refused up front; bodies without one (chunked uploads)
+    are counted as they arrive and cut off once they pass the limit. The multipart
+    envelope adds a little on top of the audio itself.
+    """
+
+    def __init__(self, app, path="/voice", max_bytes=MAX_AUDIO_BYTES + 64 * 1024):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length:
+            try:
+                content_length = int(content_length)
+            except ValueError:
+                return await JSONResponse({"error": "Invalid Content-Length header"}, status_code=400)(scope, receive, send)
+            if content_length > self.max_bytes:
+                return await JSONResponse({"error": "Audio file is too large"}, status_code=413)(scope, receive, send)
+
+        received = 0
+        too_large = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    too_large = True
+                    raise ValueError("Audio file is too large")
+            return message
+
+        async def guarded_send(message):
+            # Whatever the app makes of the cut-off body, the client gets the 413
+            if not too_large:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not too_large:
+                raise
+        if too_large:
+            await JSONResponse({"error": "Audio file is too large"}, status_code=413)(scope, receive, send)
+
+
+app.add_middleware(LimitVoiceUploadSize)
+
+@app.get("/ready")
+def ready_endpoint():
+    ready = startup_state["database"]
+    return JSONResponse(
+        {"ready": ready, **startup_state, "errors": startup_errors},
+        status_code=200 if ready else 503,
+    )
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return {"db_pool": pool_metrics(), "tool_cache": tool_cache.stats(), "vehicle_catalog": vehicle_catalog.stats()}
 
 class ChatRequest(BaseModel):
     user_id: str
@@ -16,14 +136,26 @@ class ChatRequest(BaseModel):
     context: Optional[Dict[str, Any]] = None
 
 @app.post("/chat")
-def chat_endpoint(chat: ChatRequest):
+async def chat_endpoint(chat: ChatRequest):
     user_id = chat.user_id
     user_input = chat.message
     context = chat.context
     
-    response = chat_bot(user_id, user_input, context)
+    response = await achat_bot(user_id, user_input, context)
     return {"reply": response}
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(chat: ChatRequest):
+    async def event_stream():
+        async for event in achat_bot_stream(chat.user_id, chat.message, chat.context):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/voice")
 async def voice_endpoint(
     user_id: str = Form(),
@@ -37,26 +169,19 @@ async def voice_endpoint(
     if not file.filename.endswith(ext):
         return {"error": f"Only {ext} files are supported"}
     
-    # Convert from speech to text
+    # Convert from speech to text, straight from the upload's spooled file
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-        
-        transcription = stt(tmp_path)
-        
-        # Clean up the temporary file
-        os.unlink(tmp_path)
-        
+        transcription = await astt(file.file, file.filename)
     except Exception as e:
         return {"error": str(e)}
     
-    # Get the response 
-    response = chat_bot(user_id, transcription, context)
-    
-    # Convert the response to voice
-    try:
-        audio_data = tts(response, output_voice_type, True)
-        return StreamingResponse(io.BytesIO(audio_data), media_type="audio/mpeg")
-    except Exception as e:
-        return {"error": str(e)}
+    # Stream the reply as speech, one sentence at a time while it is being generated
+    async def reply_deltas():
+        async for event in achat_bot_stream(user_id, transcription, context):
+            if event["type"] == "delta":
+                yield event["content"]
+
+    return StreamingResponse(
+        speak_stream(reply_deltas(), output_voice_type),
+        media_type="audio/mpeg",
+    )
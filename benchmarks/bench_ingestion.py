@@ -0,0 +1,56 @@
+"""
+Ingestion throughput of `build_index` for different numbers of parsing processes.
+
+Copies the PDFs in `data/` `--copies` times into a temporary corpus (each copy counts as
+a new file) and builds a fresh local index from it with each worker count. The local
+backend is used so that embedding costs nothing and the timing is parsing and splitting.
+
+Usage:
+    python -m benchmarks.bench_ingestion --copies 10 --workers 1 2 4 8
+    python -m benchmarks.bench_ingestion --copies 2 --workers 1 4 --parallel-min-files 0
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+# Must be set before the RAG helpers read it
+os.environ["RAG_BACKEND"] = "local"
+
+from helpers import rag_helper
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--copies", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--parallel-min-files", type=int, default=rag_helper.INGEST_PARALLEL_MIN_FILES,
+                        help="fewer files than this are parsed serially whatever --workers says")
+    args = parser.parse_args()
+    rag_helper.INGEST_PARALLEL_MIN_FILES = args.parallel_min_files
+
+    pdfs = [filename for filename in sorted(os.listdir(args.data)) if filename.endswith(".pdf")]
+    if not pdfs:
+        sys.exit(f"no PDFs in {args.data}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "data")
+        os.makedirs(corpus)
+        for copy in range(args.copies):
+            for filename in pdfs:
+                shutil.copy(os.path.join(args.data, filename), os.path.join(corpus, f"{copy:03d} {filename}"))
+
+        for workers in args.workers:
+            store = os.path.join(tmp, f"store-{workers}")
+            rag_helper.INGEST_WORKERS = workers
+            start = time.perf_counter()
+            chunks = rag_helper.build_index(data_path=corpus, persist_directory=store)
+            elapsed = time.perf_counter() - start
+            print(f"{workers:>2} workers  {len(pdfs) * args.copies} PDFs  {chunks:,} chunks  {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Search latency and index size of the local NumPy vector store (RAG_BACKEND=local).
+
+Embeds `--chunks` synthetic 750-character chunks with the hashing embeddings, stores them
+as float32 and as int8, and times top-k searches against each store. Query embedding is
+included in the timing, as it is when the retriever answers a question.
+
+Usage:
+    python -m benchmarks.bench_local_retriever --chunks 10000
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from helpers.local_vectorstore_helper import HashingEmbeddings, LocalVectorStore
+
+VOCABULARY = (
+    "battery capacity kwh range km charging ccs chademo type 2 connector fast charge ac dc "
+    "station power kw efficiency consumption motor torque acceleration seconds weight kg "
+    "hyundai kona renault zoe tesla model 3 nissan leaf jaguar i-pace audi e-tron warranty"
+).split()
+
+QUERIES = [
+    "Hyundai Kona battery capacity",
+    "Renault Zoe CCS charging",
+    "Tesla Model 3 range in km",
+    "which connector does the Nissan Leaf use",
+]
+
+
+def synthetic_chunks(n, seed=0):
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(n):
+        words = []
+        while sum(len(word) + 1 for word in words) < 750:
+            words.append(rng.choice(VOCABULARY) if rng.random() < 0.7 else str(rng.randint(1, 999)))
+        chunks.append(" ".join(words))
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10_000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    embeddings = HashingEmbeddings(dim=args.dim)
+    texts = synthetic_chunks(args.chunks)
+
+    for dtype in ["float32", "int8"]:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = LocalVectorStore(tmp, embeddings, dtype=dtype)
+
+            start = time.perf_counter()
+            store.add_texts(texts, [{"source": f"doc-{i % 100}.pdf"} for i in range(len(texts))])
+            indexed = time.perf_counter() - start
+            size = os.path.getsize(os.path.join(tmp, "vectors.bin"))
+
+            store.similarity_search(QUERIES[0], k=args.k)
+            start = time.perf_counter()
+            for i in range(args.repeat):
+                store.similarity_search(QUERIES[i % len(QUERIES)], k=args.k)
+            per_query = (time.perf_counter() - start) / args.repeat
+
+            print(f"{dtype:<8} indexed {args.chunks:,} chunks in {indexed:.1f}s   "
+                  f"vectors {size / 2**20:,.1f} MiB   search {per_query * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
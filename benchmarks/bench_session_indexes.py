@@ -0,0 +1,125 @@
+"""
+Scan vs. index for the session analytics queries on a synthetic `sessions` table.
+
+Builds a throwaway SQLite database with `--rows` sessions spread over `--users` users
+and three years, then times a per-user monthly energy query three ways:
+
+  1. the old predicate, DATE(created_at) >= DATE(...), without indexes (full scan)
+  2. the same old predicate with the 0003 indexes (the function call still forces a scan of the user's rows)
+  3. the half-open range on the raw column with the 0003 indexes (covering index range scan)
+
+Usage:
+    python -m benchmarks.bench_session_indexes --rows 10000000
+"""
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+
+from helpers.migrations_helper import MIGRATIONS, ConcurrentIndex
+
+OLD_QUERY = """
+    SELECT strftime('%Y-%m', created_at) AS month, SUM(kw_consumed) AS total_kwh
+    FROM sessions
+    WHERE user_id = :user_id
+        AND DATE(created_at) >= DATE(:today, '-3 months')
+    GROUP BY month
+    ORDER BY month
+"""
+
+NEW_QUERY = """
+    SELECT strftime('%Y-%m', created_at) AS month, SUM(kw_consumed) AS total_kwh
+    FROM sessions
+    WHERE user_id = :user_id
+        AND created_at >= :since
+    GROUP BY month
+    ORDER BY month
+"""
+
+PARAMS = {"user_id": "user-42", "today": "2025-06-30", "since": "2025-03-30"}
+
+
+def populate(conn, rows, users):
+    conn.execute("""
+        CREATE TABLE sessions (
+            user_id TEXT,
+            vehicle_id INTEGER,
+            duration INTEGER,
+            kw_consumed INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            id TEXT PRIMARY KEY
+        )
+    """)
+    batch = 1_000_000
+    for offset in range(0, rows, batch):
+        conn.execute("""
+            WITH RECURSIVE n(i) AS (
+                SELECT :start UNION ALL SELECT i + 1 FROM n WHERE i + 1 < :stop
+            )
+            INSERT INTO sessions (user_id, vehicle_id, duration, kw_consumed, created_at, id)
+            SELECT 'user-' || (i % :users),
+                   i % 50,
+                   10 + i % 110,
+                   5 + i % 70,
+                   datetime('2022-07-01', '+' || (i * 7919 % 94608000) || ' seconds'),
+                   'session-' || i
+            FROM n
+        """, {"start": offset, "stop": min(offset + batch, rows), "users": users})
+        conn.commit()
+
+
+def add_indexes(conn):
+    # Only the sessions indexes apply to this table
+    steps = dict(MIGRATIONS)["0003_tool_indexes"]
+    for step in steps:
+        if isinstance(step, ConcurrentIndex) and step.table == "sessions":
+            conn.execute(step.sql())
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def timed(conn, query, repeat):
+    plan = " / ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, PARAMS))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = conn.execute(query, PARAMS).fetchall()
+    elapsed = (time.perf_counter() - start) / repeat
+    return elapsed, plan, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+
+        start = time.perf_counter()
+        populate(conn, args.rows, args.users)
+        print(f"Inserted {args.rows:,} sessions in {time.perf_counter() - start:.1f}s")
+
+        cases = [("DATE() predicate, no index", OLD_QUERY)]
+        results = [timed(conn, OLD_QUERY, args.repeat)]
+
+        start = time.perf_counter()
+        add_indexes(conn)
+        print(f"Built indexes in {time.perf_counter() - start:.1f}s\n")
+
+        cases += [("DATE() predicate, indexed", OLD_QUERY), ("half-open range, indexed", NEW_QUERY)]
+        results += [timed(conn, OLD_QUERY, args.repeat), timed(conn, NEW_QUERY, args.repeat)]
+
+        assert results[0][2] == results[2][2], "rewritten query returned different rows"
+
+        for (label, _), (elapsed, plan, _) in zip(cases, results):
+            print(f"{label:<28} {elapsed * 1000:>10.2f} ms   {plan}")
+        print(f"\nSpeed-up: {results[0][0] / results[2][0]:,.0f}x")
+
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
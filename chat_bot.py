@@ -1,29 +1,223 @@
 import os
 import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 from helpers.tools_sql_helper import *
 from helpers.chat_history_helper import *
 from helpers.instructions_helper import get_system_instructions
+from helpers.context_helper import context_window
+from helpers.tool_cache_helper import tool_cache
+from helpers.response_templates_helper import render_template_reply
 
 load_dotenv()
 
 api_key = os.getenv("OPENAI_API_KEY")
 client = OpenAI(api_key=api_key)
+async_client = AsyncOpenAI(api_key=api_key)
 
-def chat_bot(user_id: str, user_input: str, context: Optional[Dict[str, Any]] = None) -> str:
+# Tool calls of one assistant turn run concurrently on this bounded pool
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", 30))
+# Write tools cannot be abandoned safely (the write may still commit), so they get longer
+WRITE_TOOL_TIMEOUT_SECONDS = float(os.getenv("WRITE_TOOL_TIMEOUT_SECONDS", 120))
+tool_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TOOL_WORKERS", 16)), thread_name_prefix="tool"
+)
+
+available_functions = {
+    "getVehiclesData": getVehiclesData,
+    "getVehicleSpecs": getVehicleSpecs,
+    "getMonthlySpending": getMonthlySpending,
+    "getAvgTransactionAmount": getAvgTransactionAmount,
+    "getMaxTransactions": getMaxTransactions,
+    "getMonthlyEnergyUsage": getMonthlyEnergyUsage,
+    "getMonthlyEnergyPerVehicle": getMonthlyEnergyPerVehicle,
+    "getAvgSessionDurationPerVehicle": getAvgSessionDurationPerVehicle,
+    "getMostFrequentChargingWeekdays": getMostFrequentChargingWeekdays,
+    "getMonthlyUsageTrends": getMonthlyUsageTrends,
+    "getMostEfficientMonth": getMostEfficientMonth,
+    "getAvgSessionStats": getAvgSessionStats,
+    "reserveSession": reserveSession,
+    "retrieveEVKnowledge": retrieveEVKnowledge
+}
+
+# Read-only tools whose results are reused from `tool_cache` for a short while
+cached_tools = {
+    "getVehiclesData",
+    "getMonthlySpending",
+    "getAvgTransactionAmount",
+    "getMaxTransactions",
+    "getMonthlyEnergyUsage",
+    "getMonthlyEnergyPerVehicle",
+    "getAvgSessionDurationPerVehicle",
+    "getMostFrequentChargingWeekdays",
+    "getMonthlyUsageTrends",
+    "getMostEfficientMonth",
+    "getAvgSessionStats",
+}
+
+# A successful call to one of these drops the user's cached tool results
+write_tools = {"reserveSession"}
+
+# Shown to the user while a tool runs on the streaming endpoint
+tool_progress_messages = {
+    "getVehiclesData": "Looking up your vehicles…",
+    "getVehicleSpecs": "Looking up vehicle specs…",
+    "getMonthlySpending": "Checking your transactions…",
+    "getAvgTransactionAmount": "Checking your transactions…",
+    "getMaxTransactions": "Checking your transactions…",
+    "getMonthlyEnergyUsage": "Querying your sessions…",
+    "getMonthlyEnergyPerVehicle": "Querying your sessions…",
+    "getAvgSessionDurationPerVehicle": "Querying your sessions…",
+    "getMostFrequentChargingWeekdays": "Querying your sessions…",
+    "getMonthlyUsageTrends": "Querying your sessions…",
+    "getMostEfficientMonth": "Querying your sessions…",
+    "getAvgSessionStats": "Querying your sessions…",
+    "reserveSession": "Reserving your session…",
+    "retrieveEVKnowledge": "Searching the EV knowledge base…",
+}
+
+
+def build_messages(user_id: str, user_input: str, context: Optional[Dict[str, Any]] = None):
     instructions = get_system_instructions(user_id)
-    
+
     if context:
         instructions += f"\n context: {context}"
-    
-    append_message(user_id, "user", user_input)
 
-    messages = get_history(user_id)
-    if not any(m["role"] == "system" for m in messages):
-        messages.insert(0, {"role": "system", "content": instructions})
+    # System prompt, running summary and the recent turns that fit the token budget
+    return context_window.build(user_id, instructions, [{"role": "user", "content": user_input}])
+
+
+def assistant_tool_message(response_message):
+    return {
+        "role": response_message.role,
+        "content": None,
+        "tool_calls": [
+            {
+                "id": tc.id,
+                "type": tc.type,
+                "function": {
+                    "name": tc.function.name,
+                    "arguments": tc.function.arguments,
+                },
+            }
+            for tc in response_message.tool_calls
+        ],
+    }
+
+
+def run_tool(user_id: str, tool_call):
+    function_name = tool_call["function"]["name"]
+    function_to_call = available_functions[function_name]
+    function_args = json.loads(tool_call["function"]["arguments"])
+
+    function_args["user_id"] = user_id
+
+    function_response = None
+    if function_name in cached_tools:
+        function_response = tool_cache.get(user_id, function_name, function_args)
+    if function_response is None:
+        function_response = function_to_call(**function_args)
+        if function_name in cached_tools:
+            tool_cache.put(user_id, function_name, function_args, function_response)
+        elif function_name in write_tools and function_response.get("status") == "success":
+            tool_cache.invalidate(user_id)
+
+    return {
+        "tool_call_id": tool_call["id"],
+        "role": "tool",
+        "name": function_name,
+        "content": json.dumps(function_response),
+    }
+
+
+def tool_error_message(tool_call, message: str):
+    return {
+        "tool_call_id": tool_call["id"],
+        "role": "tool",
+        "name": tool_call["function"]["name"],
+        "content": json.dumps({"status": "error", "message": message}),
+    }
+
+
+def tool_timeout(tool_call):
+    if tool_call["function"]["name"] in write_tools:
+        return WRITE_TOOL_TIMEOUT_SECONDS
+    return TOOL_TIMEOUT_SECONDS
+
+
+def tool_timeout_message(tool_call):
+    """
+    Result for a tool that did not finish in time. The thread keeps running, so a write
+    may still commit: it is reported as unknown rather than failed, so it is not retried.
+    """
+    if tool_call["function"]["name"] in write_tools:
+        return {
+            "tool_call_id": tool_call["id"],
+            "role": "tool",
+            "name": tool_call["function"]["name"],
+            "content": json.dumps({
+                "status": "unknown",
+                "message": "The request is still being processed and may already have succeeded. "
+                           "Do not retry it; ask the user to check again in a moment.",
+            }),
+        }
+    return tool_error_message(tool_call, "The tool timed out.")
+
+
+def run_tools(user_id: str, tool_calls):
+    """
+    Run all tool calls of a turn concurrently and return their messages in `tool_calls` order.
+    A tool that fails or exceeds its timeout yields an error result instead of failing the turn;
+    a write tool that exceeds it yields an "unknown" result.
+    """
+    futures = [tool_executor.submit(run_tool, user_id, tool_call) for tool_call in tool_calls]
+    start = time.monotonic()
+
+    tool_msgs = []
+    for tool_call, future in zip(tool_calls, futures):
+        try:
+            remaining = start + tool_timeout(tool_call) - time.monotonic()
+            tool_msgs.append(future.result(timeout=max(0, remaining)))
+        except TimeoutError:
+            tool_msgs.append(tool_timeout_message(tool_call))
+        except Exception as e:
+            print(e)
+            tool_msgs.append(tool_error_message(tool_call, str(e)))
+    return tool_msgs
+
+
+async def arun_tools(user_id: str, tool_calls):
+    """
+    Async counterpart of `run_tools`, on the same bounded pool.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def run_one(tool_call):
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(tool_executor, run_tool, user_id, tool_call),
+                tool_timeout(tool_call),
+            )
+        except asyncio.TimeoutError:
+            return tool_timeout_message(tool_call)
+        except Exception as e:
+            print(e)
+            return tool_error_message(tool_call, str(e))
+
+    # gather keeps the input order, so results line up with the tool_call ids
+    return await asyncio.gather(*(run_one(tool_call) for tool_call in tool_calls))
+
+
+def chat_bot(user_id: str, user_input: str, context: Optional[Dict[str, Any]] = None) -> str:
+    messages = build_messages(user_id, user_input, context)
+
+    # Everything produced in this turn is persisted together once the turn completes
+    turn_messages = [("user", user_input)]
 
     response = client.chat.completions.create(
         model="gpt-4o-mini",
@@ -35,80 +229,216 @@ def chat_bot(user_id: str, user_input: str, context: Optional[Dict[str, Any]] =
     response_message = response.choices[0].message
     tool_calls = response_message.tool_calls
 
-    available_functions = {
-        "getVehiclesData": getVehiclesData,
-        "getMonthlySpending": getMonthlySpending,
-        "getAvgTransactionAmount": getAvgTransactionAmount,
-        "getMaxTransactions": getMaxTransactions,
-        "getMonthlyEnergyUsage": getMonthlyEnergyUsage,
-        "getMonthlyEnergyPerVehicle": getMonthlyEnergyPerVehicle,
-        "getAvgSessionDurationPerVehicle": getAvgSessionDurationPerVehicle,
-        "getMostFrequentChargingWeekdays": getMostFrequentChargingWeekdays,
-        "getMonthlyUsageTrends": getMonthlyUsageTrends,
-        "getMostEfficientMonth": getMostEfficientMonth,
-        "getAvgSessionStats": getAvgSessionStats,
-        "reserveSession": reserveSession,
-        "retrieveEVKnowledge": retrieveEVKnowledge
-    }
+    if tool_calls:
+        assistant_tool_msg = assistant_tool_message(response_message)
+        turn_messages.append((response_message.role, assistant_tool_msg))
+        messages.append(assistant_tool_msg)
+
+        tool_msgs = run_tools(user_id, assistant_tool_msg["tool_calls"])
+        for tool_msg in tool_msgs:
+            turn_messages.append(("tool", tool_msg))
+            messages.append(tool_msg)
+
+        # Deterministic tools are phrased from templates, saving the second completion
+        reply = render_template_reply(user_id, assistant_tool_msg["tool_calls"], tool_msgs)
+        if reply is None:
+            final_response = client.chat.completions.create(
+                model="gpt-4o-mini", messages=messages, tools=tools_sql, tool_choice="none"
+            )
+            reply = final_response.choices[0].message.content
+
+        turn_messages.append(("assistant", reply))
+        append_messages(user_id, turn_messages)
+
+        return reply
+
+    else:
+        # No tool used, just direct assistant response
+        turn_messages.append(("assistant", response_message.content))
+        append_messages(user_id, turn_messages)
+        return response_message.content
+
+
+async def achat_bot(user_id: str, user_input: str, context: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Same turn as `chat_bot`, without blocking the event loop: completions go through
+    `AsyncOpenAI` and the database and tool work runs in worker threads.
+    """
+    messages = await asyncio.to_thread(build_messages, user_id, user_input, context)
+
+    # Everything produced in this turn is persisted together once the turn completes
+    turn_messages = [("user", user_input)]
+
+    response = await async_client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        tools=tools_sql,
+        tool_choice="auto",
+    )
+
+    response_message = response.choices[0].message
+    tool_calls = response_message.tool_calls
 
     if tool_calls:
-        assistant_tool_msg = {
-            "role": response_message.role,
-            "content": None,
-            "tool_calls": [
-                {
-                    "id": tc.id,
-                    "type": tc.type,
-                    "function": {
-                        "name": tc.function.name,
-                        "arguments": tc.function.arguments,
-                    },
-                }
-                for tc in tool_calls
-            ],
-        }
-        append_message(user_id, response_message.role, assistant_tool_msg)
-
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            function_to_call = available_functions[function_name]
-            function_args = json.loads(tool_call.function.arguments)
-            
-            function_args["user_id"] = user_id
-            
-            function_response = function_to_call(**function_args)
-
-            tool_msg = {
-                "tool_call_id": tool_call.id,
-                "role": "tool",
-                "name": function_name,
-                "content": json.dumps(function_response),
-            }
-            append_message(user_id, "tool", tool_msg)
+        assistant_tool_msg = assistant_tool_message(response_message)
+        turn_messages.append((response_message.role, assistant_tool_msg))
+        messages.append(assistant_tool_msg)
 
-        messages = get_history(user_id)
-        if not any(m["role"] == "system" for m in messages):
-            messages.insert(0, {"role": "system", "content": instructions})
+        tool_msgs = await arun_tools(user_id, assistant_tool_msg["tool_calls"])
+        for tool_msg in tool_msgs:
+            turn_messages.append(("tool", tool_msg))
+            messages.append(tool_msg)
 
-        final_response = client.chat.completions.create(
-            model="gpt-4o-mini", messages=messages, tools=tools_sql, tool_choice="none"
-        )
+        # Deterministic tools are phrased from templates, saving the second completion
+        # May look up the user's name, which is a blocking call on a profile cache miss
+        reply = await asyncio.to_thread(render_template_reply, user_id, assistant_tool_msg["tool_calls"], tool_msgs)
+        if reply is None:
+            final_response = await async_client.chat.completions.create(
+                model="gpt-4o-mini", messages=messages, tools=tools_sql, tool_choice="none"
+            )
+            reply = final_response.choices[0].message.content
 
-        assistant_final = final_response.choices[0].message
-        append_message(user_id, "assistant", assistant_final.content)
+        turn_messages.append(("assistant", reply))
+        await asyncio.to_thread(append_messages, user_id, turn_messages)
 
-        return assistant_final.content
+        return reply
 
     else:
         # No tool used, just direct assistant response
-        append_message(user_id, "assistant", response_message.content)
+        turn_messages.append(("assistant", response_message.content))
+        await asyncio.to_thread(append_messages, user_id, turn_messages)
         return response_message.content
-    
-    
+
+
+# Turns saved in the background; referenced here so they are not garbage-collected mid-write
+background_saves = set()
+
+
+def save_turn(user_id: str, turn_messages):
+    try:
+        append_messages(user_id, turn_messages)
+    except Exception as e:
+        print(e)
+
+
+def save_turn_in_background(user_id: str, turn_messages):
+    """
+    Persist a turn on a task of its own, so the write completes even if the caller is cancelled.
+    """
+    task = asyncio.get_running_loop().create_task(asyncio.to_thread(save_turn, user_id, turn_messages))
+    background_saves.add(task)
+    task.add_done_callback(background_saves.discard)
+    return task
+
+
+def interrupted_turn(turn_messages, content_parts):
+    """
+    What a turn cut short produced, in a shape the model accepts as history: tool calls
+    without results get "unknown outcome" results, as they may still be running.
+    """
+    turn_messages = list(turn_messages)
+    role, last = turn_messages[-1]
+    if role == "assistant" and isinstance(last, dict) and last.get("tool_calls"):
+        turn_messages += [("tool", tool_timeout_message(tool_call)) for tool_call in last["tool_calls"]]
+    if content_parts:
+        turn_messages.append(("assistant", "".join(content_parts)))
+    return turn_messages
+
+
+async def achat_bot_stream(user_id: str, user_input: str, context: Optional[Dict[str, Any]] = None):
+    """
+    Streaming variant of `achat_bot`. Yields events as they happen:
+    `{"type": "progress", "tool": ..., "message": ...}` before tools run,
+    `{"type": "delta", "content": ...}` for every piece of the answer, and
+    `{"type": "done", "reply": ...}` once the assembled reply has been saved to the history.
+    A stream closed early still saves what the turn had produced.
+    """
+    messages = await asyncio.to_thread(build_messages, user_id, user_input, context)
+
+    # Everything produced in this turn is persisted together once the turn completes
+    turn_messages = [("user", user_input)]
+    content_parts = []
+    saved = None
+
+    try:
+        # The first completion is streamed too, so a direct answer starts arriving immediately
+        stream = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            tools=tools_sql,
+            tool_choice="auto",
+            stream=True,
+        )
+
+        tool_calls = {}
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                yield {"type": "delta", "content": delta.content}
+            for tc in delta.tool_calls or []:
+                # Tool calls arrive in fragments, keyed by their position in the message
+                call = tool_calls.setdefault(
+                    tc.index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}}
+                )
+                if tc.id:
+                    call["id"] = tc.id
+                if tc.function and tc.function.name:
+                    call["function"]["name"] += tc.function.name
+                if tc.function and tc.function.arguments:
+                    call["function"]["arguments"] += tc.function.arguments
+
+        if tool_calls:
+            assistant_tool_msg = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [tool_calls[index] for index in sorted(tool_calls)],
+            }
+            turn_messages.append(("assistant", assistant_tool_msg))
+            messages.append(assistant_tool_msg)
+
+            for tool_call in assistant_tool_msg["tool_calls"]:
+                name = tool_call["function"]["name"]
+                yield {"type": "progress", "tool": name, "message": tool_progress_messages.get(name, "Working on it…")}
+
+            tool_msgs = await arun_tools(user_id, assistant_tool_msg["tool_calls"])
+            for tool_msg in tool_msgs:
+                turn_messages.append(("tool", tool_msg))
+                messages.append(tool_msg)
+
+            content_parts = []
+            templated = await asyncio.to_thread(render_template_reply, user_id, assistant_tool_msg["tool_calls"], tool_msgs)
+            if templated is not None:
+                content_parts.append(templated)
+                yield {"type": "delta", "content": templated}
+            else:
+                final_stream = await async_client.chat.completions.create(
+                    model="gpt-4o-mini", messages=messages, tools=tools_sql, tool_choice="none", stream=True
+                )
+                async for chunk in final_stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        content_parts.append(chunk.choices[0].delta.content)
+                        yield {"type": "delta", "content": chunk.choices[0].delta.content}
+
+        reply = "".join(content_parts)
+        turn_messages.append(("assistant", reply))
+        saved = save_turn_in_background(user_id, turn_messages)
+        await asyncio.shield(saved)
+
+        yield {"type": "done", "reply": reply}
+    finally:
+        # A closed stream (client disconnect) still records what the turn produced,
+        # including tool calls that may already have taken effect
+        if saved is None:
+            save_turn_in_background(user_id, interrupted_turn(turn_messages, content_parts))
+
+
 if __name__ == "__main__":
     # Set your actual user ID
     user_id = "73f52a4b-fd1b-4119-9233-ff8a956f5512"
 
     # New user input
     user_input = f"""what is the average transaction for the last 4 months"""
-    print(chat_bot(user_id, user_input))
\ No newline at end of file
+    print(chat_bot(user_id, user_input))
@@ -1,54 +1,111 @@
 from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 import json
 
-from helpers.database_connector import connect_to_db
+from helpers.database_connector import get_engine
+
+APPEND_RETRIES = 5
+
+_LAST_SEQ = text("SELECT COALESCE(MAX(seq), 0) FROM chat_messages WHERE user_id = :uid")
+
+_INSERT_MESSAGE = text("""
+    INSERT INTO chat_messages (user_id, seq, role, message_json)
+    VALUES (:uid, :seq, :role, :msg)
+""")
+
+_SELECT_ALL = text("""
+    SELECT message_json FROM chat_messages
+    WHERE user_id = :uid
+    ORDER BY seq
+""")
+
+_SELECT_AFTER = text("""
+    SELECT seq, message_json FROM chat_messages
+    WHERE user_id = :uid AND seq > :after
+    ORDER BY seq DESC
+    LIMIT :n
+""")
+
+_SELECT_LAST_N = text("""
+    SELECT message_json FROM chat_messages
+    WHERE user_id = :uid
+    ORDER BY seq DESC
+    LIMIT :n
+""")
+
+
+def _to_message(role, content):
+    # 🔍 Determine correct message format
+    if isinstance(content, dict):
+        message = content.copy()
+        if "role" not in message:
+            message["role"] = role
+        # ⚠ Ensure `content=None` if it's a tool_call assistant message
+        if "tool_calls" in message:
+            message["content"] = None
+    else:
+        message = {"role": role, "content": content}
+    return message
+
+
+def append_messages(user_id, messages):
+    """
+    Append several `(role, content)` messages in one transaction.
+
+    Each message is its own row, numbered after the user's current last `seq`. If a
+    concurrent turn claimed the same numbers the primary key rejects the insert and
+    the batch is retried on top of it, so no write is lost.
+    """
+    messages = [_to_message(role, content) for role, content in messages]
+    if not messages:
+        return
+
+    for attempt in range(APPEND_RETRIES):
+        try:
+            with get_engine().begin() as conn:
+                last_seq = conn.execute(_LAST_SEQ, {"uid": user_id}).scalar()
+                conn.execute(_INSERT_MESSAGE, [
+                    {"uid": user_id, "seq": last_seq + i, "role": m["role"], "msg": json.dumps(m)}
+                    for i, m in enumerate(messages, start=1)
+                ])
+            return
+        except IntegrityError:
+            if attempt == APPEND_RETRIES - 1:
+                raise
 
-engine = connect_to_db()
 
 def append_message(user_id, role, content):
-    with engine.begin() as conn:
-        result = conn.execute(
-            text("SELECT history_json FROM chat_history WHERE user_id = :uid"),
-            {"uid": user_id}
-        ).first()
-
-        messages = json.loads(result.history_json) if result and result.history_json else []
-
-        # 🔍 Determine correct message format
-        if isinstance(content, dict):
-            message = content.copy()
-            if "role" not in message:
-                message["role"] = role
-            # ⚠ Ensure `content=None` if it's a tool_call assistant message
-            if "tool_calls" in message:
-                message["content"] = None
-        else:
-            message = {"role": role, "content": content}
+    append_messages(user_id, [(role, content)])
+
 
-        messages.append(message)
+def get_history(user_id: str, last_n: int = None):
+    """
+    Return the user's messages oldest first, or only the `last_n` most recent ones.
+    """
+    with get_engine().connect() as conn:
+        if last_n is None:
+            rows = conn.execute(_SELECT_ALL, {"uid": user_id}).all()
+        else:
+            rows = conn.execute(_SELECT_LAST_N, {"uid": user_id, "n": last_n}).all()[::-1]
 
-        conn.execute(text("""
-            INSERT INTO chat_history (user_id, history_json)
-            VALUES (:uid, :hist)
-            ON CONFLICT (user_id) DO UPDATE
-              SET history_json = EXCLUDED.history_json
-        """), {"uid": user_id, "hist": json.dumps(messages)})
+    messages = [json.loads(row.message_json) for row in rows]
 
+    # A window can start in the middle of a tool exchange; tool results without
+    # the assistant message that requested them are rejected by the API
+    while messages and messages[0]["role"] == "tool":
+        messages.pop(0)
+    return messages
 
-def get_history(user_id: str):
-    with engine.connect() as conn:
-        result = conn.execute(
-            text("SELECT history_json FROM chat_history WHERE user_id = :uid"),
-            {"uid": user_id}
-        ).first()
 
-        if result and result.history_json:
-            return json.loads(result.history_json)  # ✅ Parse string to list[dict]
-        return []
+def get_history_rows(user_id: str, after_seq: int = 0, last_n: int = 1000):
+    """
+    Return `(seq, message)` pairs newer than `after_seq`, oldest first, capped to the `last_n` most recent.
+    """
+    with get_engine().connect() as conn:
+        rows = conn.execute(_SELECT_AFTER, {"uid": user_id, "after": after_seq, "n": last_n}).all()
+    return [(row.seq, json.loads(row.message_json)) for row in reversed(rows)]
 
 
 if __name__ == "__main__":
-    history = get_history("1")
-    history.append({"role": "user", "content": "hi"})
-    assistant_msg = "hello"
-    append_message("1", "assistant", assistant_msg)
\ No newline at end of file
+    append_messages("1", [("user", "hi"), ("assistant", "hello")])
+    print(get_history("1", last_n=2))
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import tiktoken
+from dotenv import load_dotenv
+from openai import OpenAI
+from sqlalchemy import text
+
+from helpers.chat_history_helper import get_history_rows
+from helpers.database_connector import get_engine
+
+load_dotenv()
+
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+MODEL = "gpt-4o-mini"
+
+# Every chat message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_SELECT_SUMMARY = text("SELECT upto_seq, summary FROM chat_summaries WHERE user_id = :uid")
+
+_UPSERT_SUMMARY = text("""
+    INSERT INTO chat_summaries (user_id, upto_seq, summary, updated_at)
+    VALUES (:uid, :upto_seq, :summary, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE
+      SET upto_seq = EXCLUDED.upto_seq,
+          summary = EXCLUDED.summary,
+          updated_at = EXCLUDED.updated_at
+""")
+
+SUMMARY_PROMPT = """
+Summarise the conversation below between a user and an EV assistant so it can replace the original messages.
+Keep facts the assistant may need later: vehicles, dates, amounts, reservations, preferences and open questions.
+Never include internal identifiers. Answer in plain prose.
+
+Previous summary:
+{summary}
+
+New messages:
+{transcript}
+"""
+
+
+# Used when the tokenizer cannot be loaded, e.g. offline before tiktoken has cached the
+# BPE ranks (pre-seed TIKTOKEN_CACHE_DIR to avoid the download)
+CHARS_PER_TOKEN = 4
+ENCODING_RETRY_SECONDS = 600
+
+_encoding_cache = None
+_encoding_failed_at = None
+
+
+def _encoding():
+    # Loaded on first use, tiktoken may have to fetch the BPE ranks
+    global _encoding_cache, _encoding_failed_at
+    if _encoding_cache is None:
+        if _encoding_failed_at is not None and time.monotonic() - _encoding_failed_at < ENCODING_RETRY_SECONDS:
+            return None
+        try:
+            try:
+                _encoding_cache = tiktoken.encoding_for_model(MODEL)
+            except KeyError:
+                _encoding_cache = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(e)
+            _encoding_failed_at = time.monotonic()
+            return None
+    return _encoding_cache
+
+
+def _token_len(text):
+    encoding = _encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def count_tokens(message):
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    if message.get("content"):
+        tokens += _token_len(message["content"])
+    if message.get("tool_calls"):
+        tokens += _token_len(json.dumps(message["tool_calls"]))
+    if message.get("name"):
+        tokens += _token_len(message["name"])
+    return tokens
+
+
+def group_turns(rows):
+    """
+    Group `(seq, message)` rows into units that are kept or dropped as a whole:
+    an assistant message with `tool_calls` travels with the tool results answering it.
+    """
+    units = []
+    for seq, message in rows:
+        if message["role"] == "tool":
+            if units:
+                units[-1].append((seq, message))
+            # else: orphaned tool result whose request was already summarised
+            continue
+        units.append([(seq, message)])
+    return units
+
+
+class ContextWindow:
+    """
+    Builds the message list sent to the model for a user: the system prompt, a running
+    summary of everything older than the window, and the most recent turns that fit in
+    `budget_tokens`.
+
+    The summary is stored in `chat_summaries` together with the last `seq` it covers.
+    While the unsummarised turns still fit, the stored summary is reused as is. Once they
+    overflow, the window slides forward until they take at most `slide_ratio` of the
+    room left, and only the turns that fell out are folded into the summary. That leaves
+    slack for several more turns before the next summarisation call.
+    """
+
+    def __init__(self, budget_tokens=12000, reserve_tokens=2000, summary_tokens=400,
+                 slide_ratio=0.6, max_rows=1000):
+        self.budget_tokens = budget_tokens
+        self.reserve_tokens = reserve_tokens
+        self.summary_tokens = summary_tokens
+        self.slide_ratio = slide_ratio
+        self.max_rows = max_rows
+
+    def tokens(self, messages):
+        return sum(count_tokens(m) for m in messages)
+
+    def build(self, user_id, system_prompt, pending=()):
+        """
+        Return the messages for the next completion, ending with `pending` (the new user message).
+        """
+        pending = list(pending)
+        system = {"role": "system", "content": system_prompt}
+
+        with get_engine().connect() as conn:
+            stored = conn.execute(_SELECT_SUMMARY, {"uid": user_id}).first()
+        upto_seq, summary = (stored.upto_seq, stored.summary) if stored else (0, "")
+
+        units = group_turns(get_history_rows(user_id, after_seq=upto_seq, last_n=self.max_rows))
+        unit_tokens = [self.tokens([m for _, m in unit]) for unit in units]
+
+        # Room for the window once the prompt, the new messages, a summary and the reply are accounted for
+        available = (
+            self.budget_tokens
+            - self.reserve_tokens
+            - self.summary_tokens
+            - self.tokens([system] + pending)
+        )
+
+        if sum(unit_tokens) > available:
+            target = available * self.slide_ratio
+            dropped = []
+            while units and (sum(unit_tokens) > target or units[0][0][1]["role"] != "user"):
+                # Always keep at least the latest unit; a window must start at a user message
+                if len(units) == 1:
+                    break
+                dropped.extend(units.pop(0))
+                unit_tokens.pop(0)
+
+            if dropped:
+                summary = self.summarise(summary, [m for _, m in dropped])
+                upto_seq = dropped[-1][0]
+                with get_engine().begin() as conn:
+                    conn.execute(_UPSERT_SUMMARY, {"uid": user_id, "upto_seq": upto_seq, "summary": summary})
+
+        messages = [system]
+        if summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation with this user:\n{summary}",
+            })
+        messages.extend(m for unit in units for _, m in unit)
+        messages.extend(pending)
+        return messages
+
+    def summarise(self, summary, messages):
+        transcript = "\n".join(
+            f"{m['role']}: {m['content'] if m.get('content') else json.dumps(m.get('tool_calls'))}"
+            for m in messages
+        )
+        response = client.chat.completions.create(
+            model=MODEL,
+            messages=[{
+                "role": "user",
+                "content": SUMMARY_PROMPT.format(summary=summary or "(none)", transcript=transcript),
+            }],
+            temperature=0,
+            max_tokens=self.summary_tokens,
+        )
+        return response.choices[0].message.content
+
+
+context_window = ContextWindow(
+    budget_tokens=int(os.getenv("CONTEXT_BUDGET_TOKENS", 12000)),
+    reserve_tokens=int(os.getenv("CONTEXT_RESERVE_TOKENS", 2000)),
+    summary_tokens=int(os.getenv("CONTEXT_SUMMARY_TOKENS", 400)),
+)
@@ -1,28 +1,121 @@
 import os
+import time
+import threading
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, inspect
+from sqlalchemy.pool import QueuePool
+
+from helpers.migrations_helper import run_migrations
 
 load_dotenv()
 
-def connect_to_db(mock_db=True):
+# Pool sizing per engine, and therefore per worker process. Size workers so that
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays below the server's max_connections.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# psycopg prepares a statement server-side once it has run this many times on a connection.
+# Set to an empty value to disable (e.g. behind PgBouncer in transaction mode).
+PREPARE_THRESHOLD = os.getenv("DB_PREPARE_THRESHOLD", "1")
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool that also records how many checkouts it served and how long callers waited for them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def database_url(mock_db=True):
     if mock_db:
         database_file_path = "ev_charging.db"
-        engine = create_engine(f"sqlite:///{database_file_path}")
-    
-    else:
-        DB_HOST     = os.getenv("DB_HOST")
-        DB_USERNAME = os.getenv("DB_USERNAME")
-        DB_PASSWORD = os.getenv("DB_PASSWORD")
-        DB_NAME     = os.getenv("DB_NAME")
-        DB_PORT     = os.getenv("DB_PORT")
-        
-        DATABASE_URL = (
-            f"postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        )
-        engine = create_engine(DATABASE_URL)
-         
+        return f"sqlite:///{database_file_path}"
+
+    if os.getenv("DATABASE_URL"):
+        # Use the psycopg 3 driver, which supports server-side prepared statements
+        return os.getenv("DATABASE_URL").replace("postgresql://", "postgresql+psycopg://", 1)
+
+    DB_HOST     = os.getenv("DB_HOST")
+    DB_USERNAME = os.getenv("DB_USERNAME")
+    DB_PASSWORD = os.getenv("DB_PASSWORD")
+    DB_NAME     = os.getenv("DB_NAME")
+    DB_PORT     = os.getenv("DB_PORT")
+
+    return f"postgresql+psycopg://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+def get_engine(mock_db=True):
+    """
+    Return the process-wide engine for the database, creating it (and applying pending
+    migrations) on first use. Every helper shares this engine and its connection pool.
+    """
+    url = database_url(mock_db)
+    engine = _engines.get(url)
+    if engine is not None:
+        return engine
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            connect_args = {}
+            if url.startswith("postgresql+psycopg://"):
+                connect_args["prepare_threshold"] = int(PREPARE_THRESHOLD) if PREPARE_THRESHOLD else None
+            engine = create_engine(
+                url,
+                connect_args=connect_args,
+                poolclass=MeteredQueuePool,
+                pool_size=POOL_SIZE,
+                max_overflow=MAX_OVERFLOW,
+                pool_timeout=POOL_TIMEOUT,
+                pool_recycle=POOL_RECYCLE,
+                pool_pre_ping=POOL_PRE_PING,
+            )
+            run_migrations(engine)
+            _engines[url] = engine
     return engine
 
+
+def connect_to_db(mock_db=True):
+    return get_engine(mock_db)
+
+
+def pool_metrics():
+    metrics = {}
+    for engine in list(_engines.values()):
+        pool = engine.pool
+        metrics[engine.url.render_as_string(hide_password=True)] = {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "checkouts": pool.checkouts,
+            "avg_wait_ms": 1000 * pool.wait_seconds / pool.checkouts if pool.checkouts else 0.0,
+            "max_wait_ms": 1000 * pool.max_wait_seconds,
+        }
+    return metrics
+
+
 if __name__ == "__main__":
     engine = connect_to_db(False)
     inspector = inspect(engine)
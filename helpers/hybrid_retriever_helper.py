@@ -0,0 +1,153 @@
+from langchain_core.documents import Document
+
+import os
+import math
+import threading
+import numpy as np
+from collections import Counter
+
+from helpers.local_vectorstore_helper import TOKEN
+from helpers.vehicle_catalog_helper import model_key
+
+STOPWORDS = set(
+    "a an and are as at be by can do does for from how i in is it its me my of on or "
+    "the this to was what when where which who why with you your".split()
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def source_key(source):
+    # "Tesla Model3.pdf" is matched like the model name "Tesla Model 3"
+    return model_key(os.path.splitext(source)[0])
+
+
+class BM25Index:
+    """
+    Inverted index over chunk texts with Okapi BM25 scoring.
+
+    Each posting list stores its documents and their precomputed BM25 term weights, so a
+    query is one vectorised add per query term.
+    """
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.size = len(texts)
+        counts = [Counter(tokenize(text)) for text in texts]
+        lengths = np.array([sum(count.values()) for count in counts], dtype=np.float32)
+        average = lengths.mean() if self.size else 0.0
+
+        postings = {}
+        for doc, count in enumerate(counts):
+            for term, tf in count.items():
+                postings.setdefault(term, []).append((doc, tf))
+
+        self.postings = {}
+        for term, entries in postings.items():
+            docs = np.array([doc for doc, _ in entries], dtype=np.int32)
+            tf = np.array([tf for _, tf in entries], dtype=np.float32)
+            idf = math.log(1 + (self.size - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = k1 * (1 - b + b * lengths[docs] / average)
+            self.postings[term] = (docs, idf * tf * (k1 + 1) / (tf + norm))
+
+    def search(self, query, k, allowed=None):
+        """
+        Indices of the `k` best-scoring chunks, best first. `allowed` is an optional boolean mask.
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in self.postings:
+                docs, weights = self.postings[term]
+                scores[docs] += weights
+        if allowed is not None:
+            scores[~allowed] = 0
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        return hits[np.argsort(-scores[hits])]
+
+
+class HybridRetriever:
+    """
+    Keyword and vector retrieval over the same chunks, fused and reranked.
+
+    BM25 catches exact terms (model names, "CCS", "kWh") that embeddings blur, and the
+    vector store catches paraphrases. Each contributes its `fetch_k` best chunks, which are
+    merged with reciprocal rank fusion and reranked by how many query terms a chunk
+    contains. Searches can be limited to some source PDFs, or to the PDFs of a vehicle model.
+
+    The BM25 index is built from the vector store's chunks and rebuilt whenever `version()`
+    (the corpus fingerprint) changes.
+    """
+
+    def __init__(self, vectorstore, version, k=3, fetch_k=20, rrf_k=60):
+        self.vectorstore = vectorstore
+        self.version = version
+        self.k = k
+        self.fetch_k = fetch_k
+        self.rrf_k = rrf_k
+        self._lock = threading.Lock()
+        self._indexed_version = None
+
+    def _index(self):
+        version = self.version()
+        with self._lock:
+            if version != self._indexed_version:
+                stored = self.vectorstore.get()
+                self._documents = [
+                    Document(page_content=text, metadata=metadata or {})
+                    for text, metadata in zip(stored["documents"], stored["metadatas"])
+                ]
+                self._sources = np.array([doc.metadata.get("source", "") for doc in self._documents], dtype=object)
+                self._bm25 = BM25Index([doc.page_content for doc in self._documents])
+                self._indexed_version = version
+            return self._documents, self._sources, self._bm25
+
+    def sources_for_vehicle(self, vehicle_model):
+        """
+        Source PDFs whose file name matches `vehicle_model`, e.g. "Kona" -> ["Hyundai Kona.pdf"].
+        """
+        _, sources, _ = self._index()
+        wanted = model_key(vehicle_model)
+        if not wanted:
+            return []
+        return sorted({
+            source for source in set(sources)
+            if source and (wanted in source_key(source) or source_key(source) in wanted)
+        })
+
+    def search(self, query, k=None, sources=None, vehicle_model=None):
+        k = k or self.k
+        documents, all_sources, bm25 = self._index()
+        if not documents:
+            return []
+
+        if vehicle_model and not sources:
+            # An unknown model searches the whole corpus rather than nothing
+            sources = self.sources_for_vehicle(vehicle_model) or None
+        allowed = np.isin(all_sources, sources) if sources else None
+        where = {"source": {"$in": list(sources)}} if sources else None
+
+        def key(doc):
+            return doc.metadata.get("source"), doc.metadata.get("page"), doc.page_content
+
+        fused = {}
+        candidates = {}
+        keyword_hits = [documents[i] for i in bm25.search(query, self.fetch_k, allowed)]
+        vector_hits = self.vectorstore.similarity_search(query, k=self.fetch_k, filter=where)
+        for ranking in (keyword_hits, vector_hits):
+            for rank, doc in enumerate(ranking):
+                fused[key(doc)] = fused.get(key(doc), 0.0) + 1 / (self.rrf_k + rank + 1)
+                candidates.setdefault(key(doc), doc)
+
+        # Cheap rerank: favour chunks that contain more of the query's terms
+        terms = set(tokenize(query))
+
+        def score(item):
+            chunk_key, fused_score = item
+            coverage = len(terms & set(tokenize(chunk_key[2]))) / len(terms) if terms else 0.0
+            return fused_score * (1 + coverage)
+
+        ranked = sorted(fused.items(), key=score, reverse=True)
+        return [candidates[chunk_key] for chunk_key, _ in ranked[:k]]
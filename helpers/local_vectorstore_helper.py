@@ -0,0 +1,305 @@
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+import os
+import re
+import json
+import zlib
+import shutil
+import threading
+import numpy as np
+from uuid import uuid4
+
+TOKEN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+STORE_FILES = ["vectors.bin", "scales.bin", "chunks.jsonl", "deleted.json", "store.json"]
+
+
+def matches_filter(metadata, where):
+    """
+    Chroma-style metadata filter: {"field": value} or {"field": {"$in": [values]}}.
+    """
+    for field, condition in where.items():
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def normalise_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local, stateless text embeddings: word unigrams and bigrams hashed into `dim` signed
+    buckets, with sublinear term frequency and unit length. No model and no network, so
+    the index can be built and queried offline.
+    """
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+
+    def _embed(self, text):
+        tokens = TOKEN.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if features:
+            hashes = np.array([zlib.crc32(feature.encode("utf-8")) for feature in features], dtype=np.uint32)
+            signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+            np.add.at(vector, hashes % self.dim, signs)
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        return normalise_rows(vector)
+
+    def embed_documents(self, texts):
+        return [self._embed(text).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text).tolist()
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Vector store kept in plain files under `persist_directory` and searched with NumPy.
+
+    Unit-length embeddings are appended to one memory-mapped matrix, stored as float32 or
+    as int8 with a per-row scale (a quarter of the size). A query is a blocked
+    matrix-vector product over the map followed by a top-k partition, so memory stays
+    bounded by `block_rows` however large the corpus grows.
+
+    Every file is append-only: chunk texts and metadata go to `chunks.jsonl` and deletions
+    to a list of dead rows, which are masked out of searches until the store is compacted.
+    """
+
+    def __init__(self, persist_directory, embedding_function, dtype="float32", block_rows=65536):
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.requested_dtype = dtype
+        self.block_rows = block_rows
+        self._lock = threading.Lock()
+
+        self._load(dtype)
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def _path(self, name):
+        return os.path.join(self.persist_directory, name)
+
+    def _read_json(self, name, default):
+        if not os.path.exists(self._path(name)):
+            return default
+        with open(self._path(name)) as f:
+            return json.load(f)
+
+    def _write_json(self, name, value):
+        tmp_path = self._path(name) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, self._path(name))
+
+    def _load(self, dtype):
+        # An existing store keeps the dtype it was written with
+        info = self._read_json("store.json", {})
+        self.dtype = np.dtype(info.get("dtype", dtype))
+        self._dim = info.get("dim")
+
+        self._ids, self._texts, self._metadatas = [], [], []
+        offsets = [0]
+        if os.path.exists(self._path("chunks.jsonl")):
+            with open(self._path("chunks.jsonl"), "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn by a crash mid-append
+                    row = json.loads(line)
+                    self._ids.append(row["id"])
+                    self._texts.append(row["text"])
+                    self._metadatas.append(row["metadata"])
+                    offsets.append(offsets[-1] + len(line))
+        self._repair(offsets)
+        self._deleted = {row for row in self._read_json("deleted.json", []) if row < len(self._ids)}
+        self._row_of = {cid: row for row, cid in enumerate(self._ids) if row not in self._deleted}
+        self._matrix = None
+        self._scales = None
+
+    def _file_rows(self, name, row_bytes):
+        path = self._path(name)
+        return os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+
+    def _repair(self, offsets):
+        # A crash mid-append can leave vectors (and scales) without their chunk lines, or
+        # the reverse, since the files are written one after the other. Cut every file back
+        # to the rows complete in all of them, so later appends stay aligned.
+        if self._dim is None:
+            return
+        files = {"chunks.jsonl": None, "vectors.bin": self._dim * self.dtype.itemsize}
+        if self.dtype == np.int8:
+            files["scales.bin"] = 4
+        rows = len(self._ids)
+        for name, row_bytes in files.items():
+            if row_bytes:
+                rows = min(rows, self._file_rows(name, row_bytes))
+        for name, row_bytes in files.items():
+            size = offsets[rows] if row_bytes is None else rows * row_bytes
+            if os.path.exists(self._path(name)) and os.path.getsize(self._path(name)) != size:
+                with open(self._path(name), "r+b") as f:
+                    f.truncate(size)
+        del self._ids[rows:], self._texts[rows:], self._metadatas[rows:]
+
+    def _vectors(self):
+        # Mapped lazily and remapped after every write, so readers see a consistent shape
+        if self._matrix is None and self._ids:
+            self._matrix = np.memmap(self._path("vectors.bin"), dtype=self.dtype, mode="r",
+                                     shape=(len(self._ids), self._dim))
+            if self.dtype == np.int8:
+                self._scales = np.fromfile(self._path("scales.bin"), dtype=np.float32)[:len(self._ids)]
+        return self._matrix, self._scales
+
+    def _append(self, ids, texts, metadatas, vectors):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        if self._dim is None:
+            self._dim = vectors.shape[1]
+            self._write_json("store.json", {"dim": self._dim, "dtype": self.dtype.name})
+
+        if self.dtype == np.int8:
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            with open(self._path("scales.bin"), "ab") as f:
+                f.write(scales.astype(np.float32).tobytes())
+            vectors = np.round(vectors / scales[:, None])
+        with open(self._path("vectors.bin"), "ab") as f:
+            f.write(vectors.astype(self.dtype).tobytes())
+        # Rows count once their chunk line is written; rows a crash left incomplete are cut
+        # off by _repair on the next load
+        with open(self._path("chunks.jsonl"), "a") as f:
+            for cid, text, metadata in zip(ids, texts, metadatas):
+                f.write(json.dumps({"id": cid, "text": text, "metadata": metadata}) + "\n")
+
+        replaced = [self._row_of[cid] for cid in ids if cid in self._row_of]
+        for cid, text, metadata in zip(ids, texts, metadatas):
+            self._row_of[cid] = len(self._ids)
+            self._ids.append(cid)
+            self._texts.append(text)
+            self._metadatas.append(metadata)
+        if replaced:
+            self._deleted.update(replaced)
+            self._write_json("deleted.json", sorted(self._deleted))
+        self._matrix = None
+
+    def add_texts(self, texts, metadatas=None, *, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = [dict(metadata) for metadata in metadatas] if metadatas else [{} for _ in texts]
+        ids = list(ids) if ids else [uuid4().hex for _ in texts]
+        vectors = normalise_rows(np.asarray(self.embedding_function.embed_documents(texts), dtype=np.float32))
+        with self._lock:
+            self._append(ids, texts, metadatas, vectors)
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        with self._lock:
+            rows = [self._row_of.pop(cid) for cid in ids or [] if cid in self._row_of]
+            if rows:
+                self._deleted.update(rows)
+                self._write_json("deleted.json", sorted(self._deleted))
+                if len(self._deleted) > len(self._ids) // 2:
+                    self._compact()
+        return True
+
+    def _compact(self):
+        """
+        Rewrite the store without its deleted rows.
+        """
+        matrix, scales = self._vectors()
+        live = [row for row in range(len(self._ids)) if row not in self._deleted]
+        shutil.rmtree(self.persist_directory + ".compact", ignore_errors=True)
+        compacted = LocalVectorStore(self.persist_directory + ".compact", self.embedding_function, self.dtype.name)
+        for start in range(0, len(live), self.block_rows):
+            rows = live[start:start + self.block_rows]
+            vectors = np.asarray(matrix[rows], dtype=np.float32)
+            if scales is not None:
+                vectors *= scales[rows, None]
+            compacted._append(
+                [self._ids[row] for row in rows],
+                [self._texts[row] for row in rows],
+                [self._metadatas[row] for row in rows],
+                vectors,
+            )
+        self._matrix = None
+        for name in STORE_FILES:
+            if os.path.exists(compacted._path(name)):
+                os.replace(compacted._path(name), self._path(name))
+            elif os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        shutil.rmtree(compacted.persist_directory, ignore_errors=True)
+        self._load(self.dtype.name)
+
+    def delete_collection(self):
+        with self._lock:
+            # Other files in the directory, such as the index manifest, are left alone
+            for name in STORE_FILES:
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            self._load(self.requested_dtype)
+
+    def get(self):
+        """
+        Every live chunk, in the same shape as `Chroma.get()`.
+        """
+        with self._lock:
+            rows = sorted(self._row_of.values())
+            return {
+                "ids": [self._ids[row] for row in rows],
+                "documents": [self._texts[row] for row in rows],
+                "metadatas": [self._metadatas[row] for row in rows],
+            }
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        """
+        The `k` chunks closest to `query` with their cosine similarity, best first,
+        optionally restricted to chunks whose metadata matches `filter`.
+        """
+        vector = normalise_rows(np.asarray(self.embedding_function.embed_query(query), dtype=np.float32))
+        with self._lock:
+            matrix, scales = self._vectors()
+            texts, metadatas, deleted = self._texts, self._metadatas, list(self._deleted)
+        if matrix is None:
+            return []
+
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), self.block_rows):
+            block = matrix[start:start + self.block_rows]
+            if scales is None:
+                scores[start:start + len(block)] = block @ vector
+            else:
+                scores[start:start + len(block)] = (block.astype(np.float32) @ vector) * scales[start:start + len(block)]
+        scores[deleted] = -np.inf
+        if filter:
+            scores[[row for row in range(len(matrix)) if not matches_filter(metadatas[row], filter)]] = -np.inf
+
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(Document(page_content=texts[row], metadata=metadatas[row]), float(scores[row])) for row in top]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, ids=None, persist_directory="vectorstore", **kwargs):
+        store = cls(persist_directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
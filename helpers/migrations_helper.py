@@ -0,0 +1,187 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+import json
+
+from helpers.rollup_helper import install_rollup_triggers, rebuild_rollup
+
+
+def _copy_legacy_chat_history(conn):
+    """
+    Split every `chat_history.history_json` blob into one `chat_messages` row per message.
+    """
+    if "chat_history" not in inspect(conn).get_table_names():
+        return
+
+    rows = conn.execute(text("SELECT user_id, history_json FROM chat_history")).all()
+    for row in rows:
+        messages = json.loads(row.history_json) if row.history_json else []
+        if not messages:
+            continue
+        conn.execute(
+            text("""
+                INSERT INTO chat_messages (user_id, seq, role, message_json)
+                VALUES (:uid, :seq, :role, :msg)
+            """),
+            [
+                {"uid": row.user_id, "seq": seq, "role": message["role"], "msg": json.dumps(message)}
+                for seq, message in enumerate(messages, start=1)
+            ],
+        )
+
+
+class ConcurrentIndex:
+    """
+    Migration step creating an index without blocking writes to a live table.
+
+    On Postgres the index is built CONCURRENTLY, which cannot run inside a transaction,
+    so it runs on its own autocommit connection before the rest of the migration. On
+    other databases it is a plain CREATE INDEX inside the migration transaction.
+    """
+
+    def __init__(self, name, table, columns):
+        self.name = name
+        self.table = table
+        self.columns = columns
+
+    def sql(self, concurrently=False):
+        return (
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {self.name} "
+            f"ON {self.table} ({self.columns})"
+        )
+
+    def run_concurrently(self, engine):
+        with engine.connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            valid = conn.execute(
+                text("""
+                    SELECT i.indisvalid FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = :name
+                """),
+                {"name": self.name},
+            ).scalar()
+            if valid is False:
+                # Left behind by an interrupted concurrent build; IF NOT EXISTS would keep it
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.name}"))
+            conn.execute(text(self.sql(concurrently=True)))
+
+
+# Applied in order, each one inside its own transaction. A step is a SQL string, a
+# callable receiving the connection, or a ConcurrentIndex. Never edit an entry once it
+# has shipped.
+MIGRATIONS = [
+    (
+        "0001_chat_messages",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                user_id       TEXT      NOT NULL,
+                seq           INTEGER   NOT NULL,
+                role          TEXT      NOT NULL,
+                message_json  TEXT      NOT NULL,
+                created_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, seq)
+            )
+            """,
+            _copy_legacy_chat_history,
+        ],
+    ),
+    (
+        "0002_chat_summaries",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS chat_summaries (
+                user_id     TEXT      NOT NULL PRIMARY KEY,
+                upto_seq    INTEGER   NOT NULL,
+                summary     TEXT      NOT NULL,
+                updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ],
+    ),
+    (
+        # Indexes for the analytics tools. Every tool filters on user_id first, and most
+        # on a created_at range. The trailing columns make the indexes covering, so the
+        # aggregates are answered from the index without visiting the table.
+        "0003_tool_indexes",
+        [
+            ConcurrentIndex(
+                "ix_sessions_user_created", "sessions", "user_id, created_at, vehicle_id, kw_consumed, duration"
+            ),
+            ConcurrentIndex("ix_sessions_user_vehicle", "sessions", "user_id, vehicle_id, duration"),
+            ConcurrentIndex("ix_transactions_user_created", "transactions", "user_id, created_at, amount"),
+            ConcurrentIndex("ix_transactions_user_amount", "transactions", "user_id, amount"),
+            ConcurrentIndex("ix_transactions_session", "transactions", "session_id"),
+        ],
+    ),
+    (
+        # Per-user, per-vehicle monthly totals read by the monthly analytics tools,
+        # backfilled from the raw tables and kept current by helpers/rollup_helper.py
+        "0004_user_monthly_stats",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS user_monthly_stats (
+                user_id         TEXT     NOT NULL,
+                vehicle_id      INTEGER  NOT NULL,
+                month           TEXT     NOT NULL,
+                session_count   INTEGER  NOT NULL DEFAULT 0,
+                total_kwh       NUMERIC  NOT NULL DEFAULT 0,
+                total_duration  INTEGER  NOT NULL DEFAULT 0,
+                total_spent     NUMERIC  NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, vehicle_id, month)
+            )
+            """,
+            rebuild_rollup,
+        ],
+    ),
+    (
+        # Keep user_monthly_stats in step with every write to sessions and transactions,
+        # including the charging platform's, then resync whatever drifted before
+        "0005_user_monthly_stats_triggers",
+        [
+            install_rollup_triggers,
+            rebuild_rollup,
+        ],
+    ),
+]
+
+
+def run_migrations(engine):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name        TEXT      PRIMARY KEY,
+                applied_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        applied = {row.name for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+    concurrent = engine.dialect.name == "postgresql"
+    for name, steps in MIGRATIONS:
+        if name in applied:
+            continue
+        try:
+            if concurrent:
+                for step in steps:
+                    if isinstance(step, ConcurrentIndex):
+                        step.run_concurrently(engine)
+            with engine.begin() as conn:
+                for step in steps:
+                    if isinstance(step, ConcurrentIndex):
+                        if not concurrent:
+                            conn.execute(text(step.sql()))
+                    elif callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(text(step))
+                conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+        except IntegrityError:
+            # Another worker applied the same migration first
+            continue
+
+
+if __name__ == "__main__":
+    from helpers.database_connector import get_engine
+
+    # get_engine() applies pending migrations when it creates the engine
+    get_engine()
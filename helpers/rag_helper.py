@@ -2,37 +2,338 @@ from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+
+from helpers.local_vectorstore_helper import HashingEmbeddings, LocalVectorStore
+from helpers.hybrid_retriever_helper import HybridRetriever
 
 import os
+import json
+import time
+import random
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+# "chroma": OpenAI embeddings in a Chroma store. "local": hashing embeddings in a NumPy
+# store (helpers/local_vectorstore_helper.py), with no external calls at all.
+RAG_BACKEND = os.getenv("RAG_BACKEND", "chroma").lower()
+LOCAL_DTYPE = os.getenv("RAG_LOCAL_DTYPE", "float32")  # or "int8"
+LOCAL_EMBEDDING_DIM = int(os.getenv("RAG_LOCAL_EMBEDDING_DIM", 1024))
+
+# Each backend keeps its own index and manifest
+PERSIST_DIRECTORY = os.path.join("vectorstore", "local") if RAG_BACKEND == "local" else "vectorstore"
+MANIFEST_FILE = "manifest.json"
+
+# Ingestion: PDFs are parsed and split in `INGEST_WORKERS` processes, and new chunks are
+# embedded and written in batches of `EMBED_BATCH_SIZE`, at most `EMBED_CONCURRENCY` at a time.
+# Each worker imports langchain and pypdf, and build_index runs inside the web process, so
+# the default stays small however many cores the host has.
+INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", min(4, os.cpu_count() or 1)))
+# Starting the workers costs seconds, so smaller batches of files are parsed serially
+INGEST_PARALLEL_MIN_FILES = int(os.getenv("RAG_INGEST_PARALLEL_MIN_FILES", 64))
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", 64))
+EMBED_CONCURRENCY = int(os.getenv("RAG_EMBED_CONCURRENCY", 4))
+EMBED_MAX_RETRIES = int(os.getenv("RAG_EMBED_MAX_RETRIES", 5))
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def chunk_id(chunk):
+    """
+    Content-hash key of a chunk, so an unchanged chunk keeps its ID (and its embedding) across rebuilds.
+    """
+    key = f"{chunk.metadata['source']}\0{chunk.metadata.get('page', '')}\0{chunk.page_content}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def split_document(path):
+    loader = PyPDFLoader(path)
+    pages = loader.load()
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=750,
+        chunk_overlap=150,
+        separators=["\n\n", "\n", ".", " ", ""]
+    )
+    chunks = splitter.split_documents(pages)
+    for chunk in chunks:
+        chunk.metadata["source"] = os.path.basename(path)
+    return chunks
+
+
+def ordered_map(executor, fn, items, window):
+    """
+    Lazy `executor.map`: results come back in input order, and at most `window` items are
+    submitted ahead of the consumer, so a slow consumer never lets results pile up.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_split_documents(paths, workers=None):
+    """
+    Yield `(path, chunks)` for each PDF in `paths`, in order, parsing up to `workers`
+    (default `INGEST_WORKERS`) files in parallel once there are at least
+    `INGEST_PARALLEL_MIN_FILES` of them.
+    """
+    workers = min(workers or INGEST_WORKERS, len(paths))
+    if workers <= 1 or len(paths) < INGEST_PARALLEL_MIN_FILES:
+        for path in paths:
+            yield path, split_document(path)
+        return
+    # "spawn": build_index also runs in a thread of the web app, where forking is unsafe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        yield from zip(paths, ordered_map(executor, split_document, paths, window=2 * workers))
+
+
 def load_documents(data_path="data"):
-    docs = []
-    for filename in os.listdir(data_path):
-        if filename.endswith(".pdf"):
-            loader = PyPDFLoader(os.path.join(data_path, filename))
-            pages = loader.load()
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=750,
-                chunk_overlap=150,
-                separators=["\n\n", "\n", ".", " ", ""]
-            )
-            chunks = splitter.split_documents(pages)
-            for chunk in chunks:
-                chunk.metadata["source"] = filename
-            docs.extend(chunks)
-    return docs
-
-def create_vectorstore(documents):
-    embedding_model = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
-    vectorstore = Chroma.from_documents(documents, embedding_model, persist_directory="vectorstore")
-    vectorstore.persist()
+    paths = [os.path.join(data_path, filename) for filename in sorted(os.listdir(data_path)) if filename.endswith(".pdf")]
+    for _, chunks in iter_split_documents(paths):
+        yield from chunks
+
+
+def add_with_retry(vectorstore, chunks, ids, max_retries=EMBED_MAX_RETRIES):
+    """
+    Embed and upsert one batch of chunks, retrying with exponential backoff and jitter.
+    Writes are keyed by chunk ID, so a retried batch never duplicates chunks.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return vectorstore.add_documents(chunks, ids=ids)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(30, 2 ** attempt) * (0.5 + random.random())
+            print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def add_in_batches(vectorstore, batches, concurrency=EMBED_CONCURRENCY):
+    """
+    Upsert `(chunks, ids, tag)` batches with up to `concurrency` embedding requests in flight.
+    Yields each batch's `tag` once it is stored, in input order.
+    """
+    def add(batch):
+        chunks, ids, tag = batch
+        if chunks:
+            add_with_retry(vectorstore, chunks, ids)
+        return tag
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        yield from ordered_map(executor, add, batches, window=2 * concurrency)
+
+
+def load_manifest(persist_directory=PERSIST_DIRECTORY):
+    path = os.path.join(persist_directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, persist_directory=PERSIST_DIRECTORY):
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+_corpus_versions = {}
+
+
+def corpus_version(persist_directory=PERSIST_DIRECTORY):
+    """
+    Fingerprint of the indexed corpus; it changes whenever `build_index` adds, changes or removes a file.
+    """
+    path = os.path.join(persist_directory, MANIFEST_FILE)
+    mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+    # Only re-read the manifest when it was rewritten
+    cached = _corpus_versions.get(persist_directory)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    manifest = load_manifest(persist_directory)
+    digest = hashlib.sha256()
+    for filename, entry in sorted(manifest["files"].items()):
+        digest.update(f"{filename}\0{entry['hash']}\n".encode("utf-8"))
+    _corpus_versions[persist_directory] = (mtime, digest.hexdigest())
+    return digest.hexdigest()
+
+
+class QueryCachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model with an LRU of query embeddings, so a question embedded for the
+    answer cache is not embedded a second time by the retriever.
+    """
+
+    def __init__(self, embeddings, max_entries=1024):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with self._lock:
+            if text in self._queries:
+                self._queries.move_to_end(text)
+                return self._queries[text]
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self._queries[text] = vector
+            if len(self._queries) > self.max_entries:
+                self._queries.popitem(last=False)
+        return vector
+
+
+_embeddings = None
+
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        if RAG_BACKEND == "local":
+            _embeddings = QueryCachedEmbeddings(HashingEmbeddings(dim=LOCAL_EMBEDDING_DIM))
+        else:
+            _embeddings = QueryCachedEmbeddings(OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY")))
+    return _embeddings
+
+
+_local_stores = {}
+_local_stores_lock = threading.Lock()
+
+
+def open_vectorstore(persist_directory=PERSIST_DIRECTORY):
+    if RAG_BACKEND == "local":
+        # One instance per directory, so the retriever sees what build_index writes
+        with _local_stores_lock:
+            if persist_directory not in _local_stores:
+                _local_stores[persist_directory] = LocalVectorStore(
+                    persist_directory, get_embeddings(), dtype=LOCAL_DTYPE
+                )
+            return _local_stores[persist_directory]
+    return Chroma(persist_directory=persist_directory, embedding_function=get_embeddings())
+
+
+def build_index(data_path="data", persist_directory=PERSIST_DIRECTORY):
+    """
+    Bring the persisted vector store in line with the PDFs in `data_path`.
+
+    Files whose hash matches the manifest are skipped without being parsed. For new or
+    changed files only the chunks whose content hash is not already stored get embedded,
+    and chunks of changed or deleted files that no longer exist are removed.
+    Returns the number of chunks embedded.
+    """
+    manifest = load_manifest(persist_directory)
+    known_files = manifest["files"]
+
+    current_hashes = {
+        filename: file_hash(os.path.join(data_path, filename))
+        for filename in sorted(os.listdir(data_path))
+        if filename.endswith(".pdf")
+    }
+
+    changed = [
+        filename for filename, digest in current_hashes.items()
+        if known_files.get(filename, {}).get("hash") != digest
+    ]
+    removed = [filename for filename in known_files if filename not in current_hashes]
+
+    if not changed and not removed:
+        return 0
+
+    vectorstore = open_vectorstore(persist_directory)
+    if not known_files:
+        # Stores written before the manifest existed hold duplicated, randomly keyed chunks
+        vectorstore.delete_collection()
+        vectorstore = open_vectorstore(persist_directory)
+
+    stored_ids = {cid for entry in known_files.values() for cid in entry["chunk_ids"]}
+    embedded = 0
+
+    stale_ids = [cid for filename in removed for cid in known_files.pop(filename)["chunk_ids"]]
+    if stale_ids:
+        vectorstore.delete(ids=stale_ids)
+
+    def batches():
+        # Parsed files stream in from the process pool. Each file ends with an empty batch
+        # tagged with its manifest entry, so it is recorded once all its chunks are stored
+        nonlocal embedded
+        paths = [os.path.join(data_path, filename) for filename in changed]
+        for path, split in iter_split_documents(paths):
+            filename = os.path.basename(path)
+            chunks = {}
+            for chunk in split:
+                chunks.setdefault(chunk_id(chunk), chunk)
+            ids = list(chunks)
+            stale = set(known_files.get(filename, {}).get("chunk_ids", [])) - set(ids)
+
+            new = [(cid, chunk) for cid, chunk in chunks.items() if cid not in stored_ids]
+            stored_ids.update(cid for cid, _ in new)
+            embedded += len(new)
+            for start in range(0, len(new), EMBED_BATCH_SIZE):
+                batch = new[start:start + EMBED_BATCH_SIZE]
+                yield [chunk for _, chunk in batch], [cid for cid, _ in batch], None
+            yield [], [], (filename, {"hash": current_hashes[filename], "chunk_ids": ids}, stale)
+
+    for done in add_in_batches(vectorstore, batches()):
+        if done:
+            filename, entry, stale = done
+            if stale:
+                vectorstore.delete(ids=sorted(stale))
+            known_files[filename] = entry
+            # Progress survives an interrupted run: finished files are not parsed or embedded again
+            save_manifest(manifest, persist_directory)
+
+    save_manifest(manifest, persist_directory)
+    return embedded
+
+
+def create_vectorstore(documents, persist_directory=PERSIST_DIRECTORY):
+    """
+    Store `documents` (any iterable, consumed lazily) in batches.
+    """
+    vectorstore = open_vectorstore(persist_directory)
+
+    def batches():
+        batch = []
+        for doc in documents:
+            batch.append(doc)
+            if len(batch) == EMBED_BATCH_SIZE:
+                yield batch, [chunk_id(chunk) for chunk in batch], None
+                batch = []
+        if batch:
+            yield batch, [chunk_id(chunk) for chunk in batch], None
+
+    for _ in add_in_batches(vectorstore, batches()):
+        pass
     return vectorstore
 
-def get_retriever():
-    embedding_model = OpenAIEmbeddings()
-    vectorstore = Chroma(persist_directory="vectorstore", embedding_function=embedding_model)
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 3})
-    return retriever
+
+def get_retriever(persist_directory=PERSIST_DIRECTORY, k=3, fetch_k=20):
+    """
+    Hybrid BM25 + vector retriever over the persisted chunks; see helpers/hybrid_retriever_helper.py.
+    """
+    vectorstore = open_vectorstore(persist_directory)
+    return HybridRetriever(vectorstore, lambda: corpus_version(persist_directory), k=k, fetch_k=fetch_k)
@@ -0,0 +1,104 @@
+import os
+import json
+
+from helpers.instructions_helper import get_user_name
+
+# When every tool called in a turn has a template here, the reply is rendered locally from
+# the tool results and the second completion is skipped. A template receives the tool's
+# result and the arguments it was called with, and returns the reply text, or None to let
+# the model phrase the answer instead.
+TOOL_RESPONSE_TEMPLATES = os.getenv("TOOL_RESPONSE_TEMPLATES", "true").lower() == "true"
+
+# Templated replies keep the assistant's conventions: amounts carry the currency symbol
+# and the user is addressed by first name, as the system instructions ask of the model
+CURRENCY_SYMBOL = os.getenv("CURRENCY_SYMBOL", "$")
+
+
+def _amount(value):
+    return f"{CURRENCY_SYMBOL}{value:,.2f}"
+
+
+def _monthly_spending(result, args):
+    period = f"{args['start_of_period']} and {args['end_of_period']}"
+    if result["total_spent"] is None:
+        return f"You have no charging transactions between {period}."
+    return f"You spent **{_amount(result['total_spent'])}** on charging between {period}."
+
+
+def _avg_transaction_amount(result, args):
+    months = f"{args['n_months']} months"
+    if result["avg_transaction_amount"] is None:
+        return f"You have no charging transactions in the last {months}."
+    return f"Your average charging transaction over the last {months} is **{_amount(result['avg_transaction_amount'])}**."
+
+
+def _avg_session_stats(result, args):
+    if result["avg_duration"] is None:
+        return "You have no charging sessions yet."
+    reply = f"Your charging sessions last **{result['avg_duration']:.0f} minutes** on average"
+    if result["avg_kwh_per_minute"] is None:
+        return reply + "."
+    return reply + f" and deliver **{result['avg_kwh_per_minute']:.2f} kWh per minute**."
+
+
+def _vehicle_specs(result, args):
+    return f"## {result['model']}\n" + "\n".join(
+        f"- {name.replace('_', ' ').capitalize()}: {value}"
+        for name, value in result.items() if name != "model" and value is not None
+    )
+
+
+def _reserve_session(result, args):
+    if result.get("status") != "success":
+        return None
+    return (
+        "## ✅ Reservation Confirmed\n"
+        f"- Time: {args['created_at']}\n"
+        f"- Duration: {args['duration']} minutes\n"
+        f"- Energy: {args['kw_consumed']} kWh"
+    )
+
+
+response_templates = {
+    "getMonthlySpending": _monthly_spending,
+    "getAvgTransactionAmount": _avg_transaction_amount,
+    "getAvgSessionStats": _avg_session_stats,
+    "getVehicleSpecs": _vehicle_specs,
+    "reserveSession": _reserve_session,
+}
+
+
+def _address(reply, user_id):
+    first_name = (get_user_name(user_id) or {}).get("first_name")
+    if not first_name:
+        return reply
+    if reply.startswith("#"):
+        return f"{reply}\n\nAnything else I can help with, {first_name}?"
+    return f"{first_name}, {reply[0].lower()}{reply[1:]}"
+
+
+def render_template_reply(user_id, tool_calls, tool_msgs):
+    """
+    Reply for the turn built from templates, or None if any tool lacks one or could not be rendered.
+    """
+    if not TOOL_RESPONSE_TEMPLATES:
+        return None
+
+    parts = []
+    for tool_call, tool_msg in zip(tool_calls, tool_msgs):
+        template = response_templates.get(tool_call["function"]["name"])
+        if template is None:
+            return None
+        try:
+            result = json.loads(tool_msg["content"])
+            # Failed tools return None or an error status; the model explains those better
+            if result is None or result.get("status") == "error":
+                return None
+            part = template(result, json.loads(tool_call["function"]["arguments"]))
+        except Exception as e:
+            print(e)
+            return None
+        if part is None:
+            return None
+        parts.append(part)
+    return _address("\n\n".join(parts), user_id) if parts else None
@@ -0,0 +1,199 @@
+from sqlalchemy import bindparam, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from helpers.schema_helper import sessions, transactions, user_monthly_stats, year_month
+
+# `user_monthly_stats` holds one row per (user, vehicle, month) with running totals, so the
+# monthly analytics tools read O(months) rows instead of aggregating every raw session.
+# Row triggers on sessions and transactions (installed by migration 0005) keep it in step
+# with every INSERT, UPDATE and DELETE, whoever writes them. Run this module to rebuild
+# it from scratch.
+
+KEY = ["user_id", "vehicle_id", "month"]
+COUNTERS = ["session_count", "total_kwh", "total_duration", "total_spent"]
+
+
+def _upsert_statement(insert):
+    statement = insert(user_monthly_stats).values({
+        **{name: bindparam(name) for name in KEY},
+        # The counters are NOT NULL; a missing duration or kWh counts as zero
+        **{name: func.coalesce(bindparam(name), 0) for name in COUNTERS},
+    })
+    return statement.on_conflict_do_update(
+        index_elements=KEY,
+        set_={name: user_monthly_stats.c[name] + statement.excluded[name] for name in COUNTERS},
+    )
+
+
+# Both backends support INSERT ... ON CONFLICT DO UPDATE; SQLAlchemy builds it per dialect
+UPSERT_SQL = {
+    "sqlite": _upsert_statement(sqlite.insert),
+    "postgresql": _upsert_statement(postgresql.insert),
+}
+
+_session_month = year_month(sessions.c.created_at).label("month")
+
+SESSION_TOTALS_SQL = (
+    select(
+        sessions.c.user_id,
+        sessions.c.vehicle_id,
+        _session_month,
+        func.count().label("session_count"),
+        func.coalesce(func.sum(sessions.c.kw_consumed), 0).label("total_kwh"),
+        func.coalesce(func.sum(sessions.c.duration), 0).label("total_duration"),
+    )
+    .where(
+        sessions.c.user_id.is_not(None),
+        sessions.c.vehicle_id.is_not(None),
+        sessions.c.created_at.is_not(None),
+    )
+    .group_by(sessions.c.user_id, sessions.c.vehicle_id, _session_month)
+)
+
+_transaction_month = year_month(transactions.c.created_at).label("month")
+
+TRANSACTION_TOTALS_SQL = (
+    select(
+        transactions.c.user_id,
+        transactions.c.vehicle_id,
+        _transaction_month,
+        func.coalesce(func.sum(transactions.c.amount), 0).label("total_spent"),
+    )
+    .where(
+        transactions.c.user_id.is_not(None),
+        transactions.c.vehicle_id.is_not(None),
+        transactions.c.created_at.is_not(None),
+    )
+    .group_by(transactions.c.user_id, transactions.c.vehicle_id, _transaction_month)
+)
+
+
+def add_to_rollup(connection, rows):
+    """
+    Add each row's counters to its (user_id, vehicle_id, month) bucket, creating it if needed.
+    """
+    rows = [{**dict.fromkeys(COUNTERS, 0), **row} for row in rows]
+    if rows:
+        connection.execute(UPSERT_SQL[connection.dialect.name], rows)
+
+
+# Rollup counters fed by each raw table: counter -> source column, None counting the row
+ROLLUP_SOURCES = {
+    "sessions": {"session_count": None, "total_kwh": "kw_consumed", "total_duration": "duration"},
+    "transactions": {"total_spent": "amount"},
+}
+
+ROLLUP_UPDATE_COLUMNS = {
+    "sessions": ["user_id", "vehicle_id", "created_at", "kw_consumed", "duration"],
+    "transactions": ["user_id", "vehicle_id", "created_at", "amount"],
+}
+
+
+def _month_sql(dialect, row):
+    if dialect == "postgresql":
+        return f"to_char({row}.created_at, 'YYYY-MM')"
+    return f"strftime('%Y-%m', {row}.created_at)"
+
+
+def _apply_sql(dialect, table, row, sign):
+    """
+    Add (sign "") or subtract (sign "-") the counters of the trigger row `row` (NEW or OLD).
+    """
+    counters = ROLLUP_SOURCES[table]
+    values = [f"{sign}1" if column is None else f"{sign}COALESCE({row}.{column}, 0)" for column in counters.values()]
+    target = "user_monthly_stats." if dialect == "postgresql" else ""
+    return f"""
+        INSERT INTO user_monthly_stats (user_id, vehicle_id, month, {", ".join(counters)})
+        SELECT {row}.user_id, {row}.vehicle_id, {_month_sql(dialect, row)}, {", ".join(values)}
+        WHERE {row}.user_id IS NOT NULL AND {row}.vehicle_id IS NOT NULL AND {row}.created_at IS NOT NULL
+        ON CONFLICT (user_id, vehicle_id, month) DO UPDATE
+        SET {", ".join(f"{name} = {target}{name} + excluded.{name}" for name in counters)};
+    """
+
+
+def _prune_sql(dialect, row):
+    # A bucket whose last session and transaction went away disappears, as in a rebuild
+    return f"""
+        DELETE FROM user_monthly_stats
+        WHERE user_id = {row}.user_id AND vehicle_id = {row}.vehicle_id AND month = {_month_sql(dialect, row)}
+          AND {" AND ".join(f"{name} = 0" for name in COUNTERS)};
+    """
+
+
+def rollup_trigger_sql(dialect):
+    """
+    Statements (re)creating the rollup triggers of both raw tables for `dialect`.
+    """
+    statements = []
+    for table in ROLLUP_SOURCES:
+        columns = ", ".join(ROLLUP_UPDATE_COLUMNS[table])
+        if dialect == "postgresql":
+            statements += [
+                f"""
+                CREATE OR REPLACE FUNCTION {table}_rollup() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        {_apply_sql(dialect, table, "OLD", "-")}
+                        {_prune_sql(dialect, "OLD")}
+                    END IF;
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        {_apply_sql(dialect, table, "NEW", "")}
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+                """,
+                f"DROP TRIGGER IF EXISTS {table}_rollup ON {table}",
+                f"""
+                CREATE TRIGGER {table}_rollup
+                AFTER INSERT OR UPDATE OF {columns} OR DELETE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION {table}_rollup()
+                """,
+            ]
+        else:
+            statements += [
+                f"DROP TRIGGER IF EXISTS {table}_rollup_insert",
+                f"DROP TRIGGER IF EXISTS {table}_rollup_update",
+                f"DROP TRIGGER IF EXISTS {table}_rollup_delete",
+                f"""
+                CREATE TRIGGER {table}_rollup_insert AFTER INSERT ON {table}
+                BEGIN {_apply_sql(dialect, table, "NEW", "")} END
+                """,
+                f"""
+                CREATE TRIGGER {table}_rollup_update AFTER UPDATE OF {columns} ON {table}
+                BEGIN
+                    {_apply_sql(dialect, table, "OLD", "-")}
+                    {_prune_sql(dialect, "OLD")}
+                    {_apply_sql(dialect, table, "NEW", "")}
+                END
+                """,
+                f"""
+                CREATE TRIGGER {table}_rollup_delete AFTER DELETE ON {table}
+                BEGIN
+                    {_apply_sql(dialect, table, "OLD", "-")}
+                    {_prune_sql(dialect, "OLD")}
+                END
+                """,
+            ]
+    return statements
+
+
+def install_rollup_triggers(connection):
+    for statement in rollup_trigger_sql(connection.dialect.name):
+        connection.exec_driver_sql(statement)
+
+
+def rebuild_rollup(connection):
+    """
+    Recompute `user_monthly_stats` from the raw sessions and transactions tables.
+    """
+    connection.execute(delete(user_monthly_stats))
+    add_to_rollup(connection, [dict(row) for row in connection.execute(SESSION_TOTALS_SQL).mappings()])
+    add_to_rollup(connection, [dict(row) for row in connection.execute(TRANSACTION_TOTALS_SQL).mappings()])
+
+
+if __name__ == "__main__":
+    from helpers.database_connector import get_engine
+
+    with get_engine().begin() as connection:
+        rebuild_rollup(connection)
@@ -0,0 +1,46 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+# Tool results go straight from the DB cursor into json.dumps(), so values are mapped to
+# JSON-safe Python types here instead of building a DataFrame for a handful of rows.
+
+
+def json_value(value):
+    """
+    JSON-safe form of a DB value: Decimal -> float, dates and times -> ISO strings.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return value
+
+
+def row_dict(row):
+    return {key: json_value(value) for key, value in row._mapping.items()}
+
+
+def fetch_one(engine, statement, params):
+    """
+    First row of the result as a dict, or None when the query returns no rows.
+    """
+    with engine.connect() as connection:
+        row = connection.execute(statement, params).first()
+    return row_dict(row) if row is not None else None
+
+
+
+def fetch_table(engine, statement, params, max_rows):
+    """
+    Up to `max_rows` rows as compact columnar JSON: column names once, then one value list
+    per row. The statement should LIMIT to max_rows + 1 so truncation can be detected.
+    """
+    with engine.connect() as connection:
+        result = connection.execute(statement, params)
+        columns = list(result.keys())
+        rows = [[json_value(value) for value in row] for row in result.fetchmany(max_rows + 1)]
+    return {"columns": columns, "rows": rows[:max_rows], "truncated": len(rows) > max_rows}
@@ -0,0 +1,136 @@
+from sqlalchemy import DateTime, Integer, Numeric, String, cast, column, func, literal_column, table
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+# Timestamps are written to SQLite as 'YYYY-MM-DD HH:MM:SS', like the existing rows
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
+# Lightweight table definitions for building queries with SQLAlchemy Core. They only
+# describe the columns the queries touch; the schema itself is owned by the database.
+
+users = table(
+    "users",
+    column("id"),
+    column("first_name"),
+    column("last_name"),
+)
+
+vehicles = table(
+    "vehicles",
+    column("id"),
+    column("model"),
+    column("range"),
+    column("efficiency"),
+    column("weight"),
+    column("acceleration"),
+    column("one_stop_range"),
+    column("battery"),
+    column("fastcharge"),
+    column("towing"),
+    column("cargo_volume"),
+    column("created_at"),
+)
+
+user_vehicles = table(
+    "user_vehicles",
+    column("id"),
+    column("user_id"),
+    column("vehicle_id"),
+    column("connector_type"),
+    column("actual_battery"),
+)
+
+sessions = table(
+    "sessions",
+    column("id"),
+    column("user_id"),
+    column("vehicle_id"),
+    column("duration"),
+    column("kw_consumed"),
+    column("created_at"),
+)
+
+transactions = table(
+    "transactions",
+    column("id"),
+    column("status"),
+    column("amount"),
+    column("session_id"),
+    column("user_id"),
+    column("vehicle_id"),
+    column("created_at"),
+)
+
+# Created by migration 0004_user_monthly_stats, kept current by the triggers in helpers/rollup_helper.py
+user_monthly_stats = table(
+    "user_monthly_stats",
+    column("user_id"),
+    column("vehicle_id"),
+    column("month"),
+    column("session_count"),
+    column("total_kwh"),
+    column("total_duration"),
+    column("total_spent"),
+)
+
+
+# Date and numeric helpers that compile to each backend's native SQL. SQLite is the
+# default rendering; Postgres gets its own functions.
+
+class year_month(FunctionElement):
+    """
+    'YYYY-MM' of a timestamp.
+    """
+    type = String()
+    inherit_cache = True
+
+
+@compiles(year_month)
+def _year_month_sqlite(element, compiler, **kw):
+    return compiler.process(func.strftime(literal_column("'%Y-%m'"), *element.clauses), **kw)
+
+
+@compiles(year_month, "postgresql")
+def _year_month_postgresql(element, compiler, **kw):
+    return compiler.process(func.to_char(*element.clauses, literal_column("'YYYY-MM'")), **kw)
+
+
+class weekday(FunctionElement):
+    """
+    Day of the week of a timestamp as an integer, 0 = Sunday through 6 = Saturday.
+    """
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(weekday)
+def _weekday_sqlite(element, compiler, **kw):
+    return compiler.process(cast(func.strftime(literal_column("'%w'"), *element.clauses), Integer), **kw)
+
+
+@compiles(weekday, "postgresql")
+def _weekday_postgresql(element, compiler, **kw):
+    return compiler.process(cast(func.extract("dow", *element.clauses), Integer), **kw)
+
+
+class round_to(FunctionElement):
+    """
+    ROUND(value, digits). Postgres only rounds NUMERIC to a number of digits, so the value is cast there.
+    """
+    inherit_cache = True
+
+
+@compiles(round_to)
+def _round_to_sqlite(element, compiler, **kw):
+    value, digits = element.clauses
+    return compiler.process(func.round(value, digits), **kw)
+
+
+@compiles(round_to, "postgresql")
+def _round_to_postgresql(element, compiler, **kw):
+    value, digits = element.clauses
+    return compiler.process(func.round(cast(value, Numeric), digits), **kw)
@@ -0,0 +1,166 @@
+import re
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+
+
+def normalise_query(query: str) -> str:
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+def query_entities(query: str) -> frozenset:
+    """
+    Words that pin a question to one thing: numbers and words with digits ("3", "ID.4"),
+    single letters ("Model Y"), acronyms ("CCS") and capitalised words after the first
+    ("Renault Zoe"). Questions differing in any of them never share an answer, however
+    similar their embeddings.
+    """
+    words = re.findall(r"\w+(?:\.\w+)*", query)
+    return frozenset(
+        word.lower() for position, word in enumerate(words)
+        if any(char.isdigit() for char in word)
+        or len(word) == 1
+        or (word.isupper() and len(word) > 1)
+        or (position > 0 and word[0].isupper())
+    )
+
+
+class SemanticCache:
+    """
+    Answer cache for knowledge questions.
+
+    A question is first looked up by its normalised text. On a miss its embedding is
+    compared (cosine) against every cached question, and the closest answer is reused if
+    the similarity reaches `threshold` and both name the same entities (`query_entities`).
+    Lookups are partitioned by `scope` (e.g. the vehicle model the question was asked
+    about): an entry only answers questions of its own scope. Entries expire after `ttl_seconds`, the least
+    recently used one is evicted past `max_entries`, and everything is dropped when the
+    corpus version passed to `get`/`put` changes.
+
+    Embeddings live in one preallocated float32 matrix, so a similarity lookup is a single
+    matrix-vector product.
+    """
+
+    def __init__(self, embed, threshold=0.95, ttl_seconds=24 * 3600, max_entries=2048):
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._version = None
+        self._slots = OrderedDict()  # (scope, normalised query) -> matrix row, in LRU order
+        self._keys = [None] * max_entries
+        self._entities = [None] * max_entries
+        self._answers = [None] * max_entries
+        self._scope_codes = {}
+        self._scopes = np.full(max_entries, -1)
+        self._expires = np.zeros(max_entries)
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._matrix = None
+        self._free = list(range(max_entries))
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _reset(self, version):
+        self._version = version
+        self._slots.clear()
+        self._scope_codes.clear()
+        self._valid[:] = False
+        self._free = list(range(self.max_entries))
+
+    def _evict(self, key):
+        slot = self._slots.pop(key)
+        self._valid[slot] = False
+        self._keys[slot] = None
+        self._entities[slot] = None
+        self._answers[slot] = None
+        self._free.append(slot)
+
+    def _vector(self, query):
+        vector = np.asarray(self.embed(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _scope_code(self, scope):
+        return self._scope_codes.setdefault(scope, len(self._scope_codes))
+
+    def get(self, query: str, version: str, scope=None):
+        """
+        Return `(answer, vector)`. `answer` is None on a miss; pass `vector` on to `put`
+        so the question is not embedded twice.
+        """
+        key = (scope, normalise_query(query))
+        now = time.monotonic()
+
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            slot = self._slots.get(key)
+            if slot is not None:
+                if self._expires[slot] > now:
+                    self._slots.move_to_end(key)
+                    self.exact_hits += 1
+                    return self._answers[slot], None
+                self._evict(key)
+            if not self._slots:
+                self.misses += 1
+                return None, None
+
+        vector = self._vector(query)
+
+        with self._lock:
+            if version != self._version or self._matrix is None:
+                self.misses += 1
+                return None, vector
+            live = self._valid & (self._expires > now) & (self._scopes == self._scope_code(scope))
+            scores = np.where(live, self._matrix @ vector, -1.0)
+            entities = query_entities(query)
+            # Close questions about another vehicle or figure ("Model 3 range" vs "Model Y range") are misses
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for slot in candidates[np.argsort(-scores[candidates])]:
+                if self._entities[slot] == entities:
+                    self._slots.move_to_end(self._keys[slot])
+                    self.semantic_hits += 1
+                    return self._answers[slot], vector
+            self.misses += 1
+            return None, vector
+
+    def put(self, query: str, answer: str, version: str, vector=None, scope=None):
+        key = (scope, normalise_query(query))
+        if vector is None:
+            vector = self._vector(query)
+
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            if key in self._slots:
+                self._evict(key)
+            if not self._free:
+                self._evict(next(iter(self._slots)))
+
+            slot = self._free.pop()
+            self._slots[key] = slot
+            self._keys[slot] = key
+            self._entities[slot] = query_entities(query)
+            self._scopes[slot] = self._scope_code(scope)
+            self._matrix[slot] = vector
+            self._answers[slot] = answer
+            self._expires[slot] = time.monotonic() + self.ttl_seconds
+            self._valid[slot] = True
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._slots),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+def tool_cache_key(user_id: str, function_name: str, function_args: dict):
+    # Arguments are canonicalised so {"n": 3} and {"n": "3"} in any key order share an entry
+    args = {name: str(value).strip() for name, value in function_args.items() if name != "user_id"}
+    return user_id, function_name, json.dumps(args, sort_keys=True)
+
+
+class ToolResultCache:
+    """
+    Short-lived cache of read-only tool results, keyed by user, tool and arguments.
+
+    Entries expire after `ttl_seconds` and the least recently used one is evicted past
+    `max_entries`. `invalidate(user_id)` drops every entry of a user, and is called
+    whenever a write tool for that user succeeds.
+    """
+
+    def __init__(self, ttl_seconds=120, max_entries=4096):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, result), in LRU order
+        self._user_keys = {}  # user_id -> set of keys
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _drop(self, key):
+        del self._entries[key]
+        user_keys = self._user_keys[key[0]]
+        user_keys.discard(key)
+        if not user_keys:
+            del self._user_keys[key[0]]
+
+    def get(self, user_id: str, function_name: str, function_args: dict):
+        """
+        Cached result, or None on a miss.
+        """
+        key = tool_cache_key(user_id, function_name, function_args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, user_id: str, function_name: str, function_args: dict, result):
+        if result is None:
+            return
+        key = tool_cache_key(user_id, function_name, function_args)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            while len(self._entries) >= self.max_entries:
+                self._drop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+            self._user_keys.setdefault(user_id, set()).add(key)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            for key in self._user_keys.pop(user_id, ()):
+                del self._entries[key]
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+tool_cache = ToolResultCache(
+    ttl_seconds=float(os.getenv("TOOL_CACHE_TTL_SECONDS", 120)),
+    max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", 4096)),
+)
@@ -1,11 +1,187 @@
-import numpy as np
-import pandas as pd
-from sqlalchemy import inspect, text
+import os
+import calendar
+from datetime import date, datetime, timedelta
+from sqlalchemy import Date, bindparam, func, insert, inspect, literal_column, select
+
+from helpers.database_connector import get_engine
+from helpers.rows_helper import fetch_one, fetch_table
+from helpers.schema_helper import (
+    Timestamp, round_to, sessions, transactions, user_monthly_stats, user_vehicles, users, vehicles, weekday
+)
+from helpers.vehicle_catalog_helper import SPEC_COLUMNS, vehicle_catalog
+
+# Multi-row tools return at most this many rows, flagged "truncated" when there were more
+TOOL_MAX_ROWS = int(os.getenv("TOOL_MAX_ROWS", 50))
+
+# Every statement is built once with bound parameters, so the SQL text is identical
+# across calls: SQLAlchemy reuses its compiled form and Postgres its prepared plan.
+# Date filters are half-open ranges on the raw created_at column, so they can use the
+# (user_id, created_at, ...) indexes instead of scanning every row through DATE().
+# Statements are SQLAlchemy Core, so month/weekday/rounding compile to native SQL on
+# both SQLite and Postgres (see helpers/schema_helper.py).
+# The monthly tools read the user_monthly_stats rollup (see helpers/rollup_helper.py),
+# so they scan a few rows per month instead of the user's whole session history.
+
+USER_ID = bindparam("user_id")
+SINCE = bindparam("since", type_=Date)
+SINCE_MONTH = bindparam("since_month")
+MAX_ROWS = bindparam("max_rows")
+
+# Vehicle specs come from the in-memory catalog (helpers/vehicle_catalog_helper.py),
+# so only the user's own rows are read here
+USER_VEHICLES_SQL = (
+    select(
+        user_vehicles.c.connector_type,
+        user_vehicles.c.actual_battery,
+        user_vehicles.c.vehicle_id,
+    )
+    .select_from(users.join(user_vehicles, users.c.id == user_vehicles.c.user_id))
+    .where(users.c.id == USER_ID)
+    .order_by(user_vehicles.c.id)
+    .limit(MAX_ROWS)
+)
+
+MONTHLY_SPENDING_SQL = (
+    select(func.sum(transactions.c.amount).label("total_spent"))
+    .where(
+        transactions.c.user_id == USER_ID,
+        transactions.c.created_at >= bindparam("period_start", type_=Date),
+        transactions.c.created_at < bindparam("period_end", type_=Date),
+    )
+)
+
+AVG_TRANSACTION_AMOUNT_SQL = (
+    select(func.avg(transactions.c.amount).label("avg_transaction_amount"))
+    .where(transactions.c.user_id == USER_ID, transactions.c.created_at >= SINCE)
+)
+
+MAX_TRANSACTIONS_SQL = (
+    select(transactions.c.created_at, transactions.c.amount, vehicles.c.model.label("vehicle_model"))
+    .select_from(transactions.join(vehicles, transactions.c.vehicle_id == vehicles.c.id))
+    .where(transactions.c.user_id == USER_ID)
+    .order_by(transactions.c.amount.desc())
+    .limit(bindparam("n_highest"))
+)
+
+_stats = user_monthly_stats.c
+_monthly_kwh = func.sum(_stats.total_kwh).label("total_kwh")
+
+MONTHLY_ENERGY_USAGE_SQL = (
+    select(_stats.month, _monthly_kwh)
+    .where(_stats.user_id == USER_ID, _stats.month >= SINCE_MONTH, _stats.session_count > 0)
+    .group_by(_stats.month)
+    # Newest first, so truncation drops the oldest months
+    .order_by(_stats.month.desc())
+    .limit(MAX_ROWS)
+)
+
+MONTHLY_ENERGY_PER_VEHICLE_SQL = (
+    select(vehicles.c.model.label("vehicle_model"), _monthly_kwh)
+    .select_from(user_monthly_stats.join(vehicles, _stats.vehicle_id == vehicles.c.id))
+    .where(_stats.user_id == USER_ID, _stats.month >= SINCE_MONTH, _stats.session_count > 0)
+    .group_by(vehicles.c.id, vehicles.c.model)
+    .order_by(_monthly_kwh)
+    .limit(bindparam("n_vehicles"))
+)
+
+AVG_SESSION_DURATION_PER_VEHICLE_SQL = (
+    select(vehicles.c.model.label("vehicle_model"), func.avg(sessions.c.duration).label("avg_duration_minutes"))
+    .select_from(sessions.join(vehicles, sessions.c.vehicle_id == vehicles.c.id))
+    .where(sessions.c.user_id == USER_ID)
+    .group_by(vehicles.c.id, vehicles.c.model)
+    .order_by(vehicles.c.model)
+    .limit(MAX_ROWS)
+)
+
+_session_weekday = weekday(sessions.c.created_at).label("weekday")
+_session_count = func.count().label("session_count")
+
+MOST_FREQUENT_CHARGING_WEEKDAYS_SQL = (
+    select(_session_weekday, _session_count)
+    .where(sessions.c.user_id == USER_ID)
+    .group_by(_session_weekday)
+    .order_by(_session_count.desc())
+    .limit(MAX_ROWS)
+)
+
+MONTHLY_USAGE_TRENDS_SQL = (
+    select(
+        _stats.month,
+        func.sum(_stats.session_count).label("total_sessions"),
+        _monthly_kwh,
+        func.sum(_stats.total_spent).label("total_spent"),
+    )
+    .where(_stats.user_id == USER_ID)
+    .group_by(_stats.month)
+    .order_by(_stats.month.desc())
+    .limit(MAX_ROWS)
+)
+
+_month_efficiency = round_to(
+    func.sum(_stats.total_kwh) * literal_column("1.0") / func.sum(_stats.total_duration), 3
+).label("efficiency_kwh_per_min")
+
+MOST_EFFICIENT_MONTH_SQL = (
+    select(_stats.month, _month_efficiency)
+    .where(_stats.user_id == USER_ID)
+    .group_by(_stats.month)
+    # Months with only transactions have no charging time to divide by
+    .having(func.sum(_stats.total_duration) > 0)
+    .order_by(_month_efficiency.desc())
+    .limit(bindparam("n_months"))
+)
+
+AVG_SESSION_STATS_SQL = (
+    select(
+        func.avg(sessions.c.duration).label("avg_duration"),
+        # Zero-length sessions are left out of the average rather than failing it on Postgres
+        round_to(func.avg(sessions.c.kw_consumed * literal_column("1.0") / func.nullif(sessions.c.duration, 0)), 3)
+        .label("avg_kwh_per_minute"),
+    )
+    .where(sessions.c.user_id == USER_ID)
+)
+
+RESERVE_SESSION_SQL = insert(sessions).values(
+    user_id=USER_ID,
+    vehicle_id=bindparam("vehicle_id"),
+    duration=bindparam("duration"),
+    kw_consumed=bindparam("kw_consumed"),
+    created_at=bindparam("created_at", type_=Timestamp),
+    id=bindparam("session_id"),
+)
+
+
+def _parse_date(value):
+    return date.fromisoformat(str(value)[:10])
+
+
+def _months_before(day, n_months):
+    """
+    Same day `n_months` earlier, clamped to the end of shorter months (2025-03-31 -> 2025-02-28).
+    """
+    day = _parse_date(day)
+    month_index = day.year * 12 + day.month - 1 - int(n_months)
+    year, month = divmod(month_index, 12)
+    month += 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _month_key(day):
+    # Rollup months are 'YYYY-MM' strings, which sort chronologically
+    return day.strftime("%Y-%m")
+
 
-from helpers.database_connector import connect_to_db
-from rag import *
+def _first_record(query, params):
+    return fetch_one(get_engine(), query, params)
 
-engine = connect_to_db()
+
+def _all_records(query, params):
+    # One row past the cap tells fetch_table whether the result was cut off
+    return fetch_table(get_engine(), query, {**params, "max_rows": TOOL_MAX_ROWS + 1}, TOOL_MAX_ROWS)
+
+
+def _row_limit(n):
+    return min(int(n), TOOL_MAX_ROWS + 1)
 
 
 def getVehiclesData(user_id: str):
@@ -13,39 +189,31 @@ def getVehiclesData(user_id: str):
     Retrieve vehicles data of the user.
     """
     try:
-        query = f"""
-        SELECT
-            user_vehicles.connector_type,
-            user_vehicles.actual_battery,
-
-            vehicles.model,
-            vehicles.range,
-            vehicles.efficiency,
-            vehicles.weight,
-            vehicles.acceleration,
-            vehicles.one_stop_range,
-            vehicles.battery,
-            vehicles.fastcharge,
-            vehicles.towing,
-            vehicles.cargo_volume
-
-        FROM users
-        JOIN user_vehicles ON users.id = user_vehicles.user_id
-        JOIN vehicles ON user_vehicles.vehicle_id = vehicles.id
-
-        WHERE users.id = '{user_id}';
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        owned = _all_records(USER_VEHICLES_SQL, {"user_id": user_id})
+        rows = []
+        for connector_type, actual_battery, vehicle_id in owned["rows"]:
+            specs = vehicle_catalog.get(vehicle_id)
+            if specs is not None:
+                rows.append([connector_type, actual_battery] + [specs[name] for name in SPEC_COLUMNS])
+        return {
+            "columns": ["connector_type", "actual_battery"] + SPEC_COLUMNS,
+            "rows": rows,
+            "truncated": owned["truncated"],
+        }
+    except Exception as e:
+        print(e)
+        return None
+
+
+def getVehicleSpecs(model: str, user_id: str):
+    """
+    Look up the specifications of a vehicle model (range, efficiency, weight, acceleration, battery, fast charging, towing, cargo volume). Misspelled or partial model names are matched to the closest model.
+    """
+    try:
+        return vehicle_catalog.find(model)
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getMonthlySpending(user_id: str, start_of_period: str, end_of_period: str):
@@ -53,23 +221,15 @@ def getMonthlySpending(user_id: str, start_of_period: str, end_of_period: str):
     Calculate the total amount the user spent on charging sessions in a specific period month.
     """
     try:
-        query = f"""
-        SELECT SUM(amount) AS total_spent
-        FROM transactions
-        WHERE user_id = '{user_id}'
-            AND DATE(created_at) BETWEEN '{start_of_period}' AND '{end_of_period}';
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        return _first_record(MONTHLY_SPENDING_SQL, {
+            "user_id": user_id,
+            "period_start": _parse_date(start_of_period),
+            # The period includes its whole last day
+            "period_end": _parse_date(end_of_period) + timedelta(days=1),
+        })
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getAvgTransactionAmount(user_id: str, today: str, n_months: str):
@@ -77,24 +237,13 @@ def getAvgTransactionAmount(user_id: str, today: str, n_months: str):
     Get the average transaction amount for the user over the past n months.
     """
     try:
-        query = f"""
-        SELECT AVG(amount) AS avg_transaction_amount
-        FROM transactions
-        WHERE user_id = '{user_id}'
-            AND DATE(created_at) >= DATE('{today}', '-{n_months} months');
-
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        return _first_record(AVG_TRANSACTION_AMOUNT_SQL, {
+            "user_id": user_id,
+            "since": _months_before(today, n_months),
+        })
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getMaxTransactions(user_id: str, n_highest: str):
@@ -102,25 +251,10 @@ def getMaxTransactions(user_id: str, n_highest: str):
     Retrieve the highest n transaction (by amount) the user has ever made.
     """
     try:
-        query = f"""
-        SELECT transactions.created_at, transactions.amount, transactions.created_at, vehicles.model AS vehicle_model
-        FROM transactions, vehicles
-        WHERE transactions.vehicle_id = vehicles.id
-            AND user_id = '{user_id}'
-        ORDER BY amount DESC
-        LIMIT {n_highest};
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        return _all_records(MAX_TRANSACTIONS_SQL, {"user_id": user_id, "n_highest": _row_limit(n_highest)})
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getMonthlyEnergyUsage(user_id: str, st_date: str, n_months: str):
@@ -128,26 +262,13 @@ def getMonthlyEnergyUsage(user_id: str, st_date: str, n_months: str):
     Get the total kilowatt-hours (kWh) consumed by the user for each of the last n months.
     """
     try:
-        query = f"""
-        SELECT strftime('%Y-%m', created_at) AS month,
-            SUM(kw_consumed) AS total_kwh
-        FROM sessions
-        WHERE user_id = '{user_id}'
-            AND DATE(created_at) >= DATE('{st_date}', '-{n_months} months')
-        GROUP BY month
-        ORDER BY month;
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        return _all_records(MONTHLY_ENERGY_USAGE_SQL, {
+            "user_id": user_id,
+            "since_month": _month_key(_months_before(st_date, n_months)),
+        })
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getMonthlyEnergyPerVehicle(
@@ -157,28 +278,14 @@ def getMonthlyEnergyPerVehicle(
     Get the total kilowatt-hours (kWh) consumed by the user for each of the last n months per vehicle.
     """
     try:
-        query = f"""
-        SELECT vehicles.model AS vehicle_model,
-            SUM(sessions.kw_consumed) AS total_kwh
-        FROM sessions, vehicles
-        WHERE sessions.user_id = '{user_id}'
-            AND sessions.vehicle_id = vehicles.id
-            AND DATE(sessions.created_at) >= DATE('{today}', '-{n_months} months')
-        GROUP BY vehicle_id
-        ORDER BY total_kwh
-        LIMIT {n_vehicles};
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        return _all_records(MONTHLY_ENERGY_PER_VEHICLE_SQL, {
+            "user_id": user_id,
+            "since_month": _month_key(_months_before(today, n_months)),
+            "n_vehicles": _row_limit(n_vehicles),
+        })
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getAvgSessionDurationPerVehicle(user_id: str):
@@ -186,25 +293,10 @@ def getAvgSessionDurationPerVehicle(user_id: str):
     Compute the average duration of charging sessions for each of the user's vehicles.
     """
     try:
-        query = f"""
-        SELECT vehicles.model AS vehicle_model,
-            AVG(sessions.duration) AS avg_duration_minutes
-        FROM sessions, vehicles
-        WHERE user_id = '{user_id}'
-            AND sessions.vehicle_id = vehicles.id
-        GROUP BY vehicle_id;
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        return _all_records(AVG_SESSION_DURATION_PER_VEHICLE_SQL, {"user_id": user_id})
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getMostFrequentChargingWeekdays(user_id: str):
@@ -212,25 +304,10 @@ def getMostFrequentChargingWeekdays(user_id: str):
     Identify the days of the week when the user most frequently charges their vehicles.
     """
     try:
-        query = f"""
-        SELECT strftime('%w', created_at) AS weekday,
-            COUNT(*) AS session_count
-        FROM sessions
-        WHERE user_id = '{user_id}'
-        GROUP BY weekday
-        ORDER BY session_count DESC;
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        return _all_records(MOST_FREQUENT_CHARGING_WEEKDAYS_SQL, {"user_id": user_id})
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getMonthlyUsageTrends(user_id: str):
@@ -238,28 +315,10 @@ def getMonthlyUsageTrends(user_id: str):
     Track the user's monthly usage trends in terms of session count, energy consumption, and total spend.
     """
     try:
-        query = f"""
-        SELECT strftime('%Y-%m', s.created_at) AS month,
-            COUNT(s.id) AS total_sessions,
-            SUM(s.kw_consumed) AS total_kwh,
-            SUM(t.amount) AS total_spent
-        FROM sessions s
-        JOIN transactions t ON s.id = t.session_id
-        WHERE s.user_id = '{user_id}'
-        GROUP BY month
-        ORDER BY month;
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        return _all_records(MONTHLY_USAGE_TRENDS_SQL, {"user_id": user_id})
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getMostEfficientMonth(user_id: str, n_months: str):
@@ -267,26 +326,10 @@ def getMostEfficientMonth(user_id: str, n_months: str):
     Find the user's most efficient n months based on kWh consumed per minute of session time.
     """
     try:
-        query = f"""
-        SELECT strftime('%Y-%m', created_at) AS month,
-            ROUND(SUM(kw_consumed) * 1.0 / SUM(duration), 3) AS efficiency_kwh_per_min
-        FROM sessions
-        WHERE user_id = '{user_id}'
-        GROUP BY month
-        ORDER BY efficiency_kwh_per_min DESC
-        LIMIT {n_months};
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        return _all_records(MOST_EFFICIENT_MONTH_SQL, {"user_id": user_id, "n_months": _row_limit(n_months)})
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getAvgSessionStats(user_id: str):
@@ -294,23 +337,10 @@ def getAvgSessionStats(user_id: str):
     Return the average duration and energy consumption rate (kWh/minute) for the user's sessions.
     """
     try:
-        query = f"""
-        SELECT AVG(duration) AS avg_duration,
-            ROUND(AVG(kw_consumed * 1.0 / duration), 3) AS avg_kwh_per_minute
-        FROM sessions
-        WHERE user_id = '{user_id}';
-        """
-        query = text(query)
-
-        with engine.connect() as connection:
-            result = pd.read_sql_query(query, connection)
-        if not result.empty:
-            return result.to_dict("records")[0]
-        else:
-            return np.nan
+        return _first_record(AVG_SESSION_STATS_SQL, {"user_id": user_id})
     except Exception as e:
         print(e)
-        return np.nan
+        return None
 
 
 def getNearestStations(n_stations: int):
@@ -339,27 +369,29 @@ def reserveSession(
         session_id (str): Unique ID of the session.
     """
     try:
-        query = f"""
-        INSERT INTO sessions (
-            user_id, vehicle_id, duration, kw_consumed, created_at, id
-        )
-        VALUES (
-            '{user_id}', '{vehicle_id}', {duration}, {kw_consumed}, '{created_at}', '{session_id}'
-        );
-        """
-        query = text(query)
-        with engine.connect() as connection:
-            connection.execute(query)
-            connection.commit()
+        created_at = datetime.fromisoformat(created_at)
+        # The sessions trigger adds the session to user_monthly_stats in the same transaction
+        with get_engine().begin() as connection:
+            connection.execute(RESERVE_SESSION_SQL, {
+                "user_id": user_id,
+                "vehicle_id": vehicle_id,
+                "duration": duration,
+                "kw_consumed": kw_consumed,
+                "created_at": created_at,
+                "session_id": session_id,
+            })
         return {"status": "success", "session_id": session_id}
     except Exception as e:
         print(e)
         return {"status": "error", "message": str(e)}
 
 
-def retrieveEVKnowledge(query: str, user_id: str) -> str:
-    """Answer general EV-related questions using the knowledge base"""
-    return rag(query)
+def retrieveEVKnowledge(query: str, user_id: str, vehicle_model: str = None) -> str:
+    """Answer general EV-related questions using the knowledge base, optionally limited to one vehicle model's documents"""
+    # Imported on first use: the RAG stack (langchain, chromadb, the index) is heavy to load
+    from rag import rag
+
+    return rag(query, vehicle_model)
 
 
 tools_sql = [
@@ -381,6 +413,28 @@ tools_sql = [
         },
     },
     
+    {
+        "type": "function",
+        "function": {
+            "name": "getVehicleSpecs",
+            "description": getVehicleSpecs.__doc__,
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "model": {
+                        "type": "string",
+                        "description": "The vehicle model, e.g. 'Tesla Model 3'.",
+                    },
+                    "user_id": {
+                        "type": "string",
+                        "description": "The unique identifier of the user.",
+                    },
+                },
+                "required": ["model", "user_id"],
+            },
+        },
+    },
+    
     {
         "type": "function",
         "function": {
@@ -655,6 +709,10 @@ tools_sql = [
                         "type": "string",
                         "description": "The unique identifier of the user.",
                     },
+                    "vehicle_model": {
+                        "type": "string",
+                        "description": "Optional vehicle model the question is about, e.g. 'Hyundai Kona', to search only its documents.",
+                    },
                 },
                 "required": ["query", "user_id"],
             },
@@ -664,7 +722,7 @@ tools_sql = [
 
 
 if __name__ == "__main__":
-    inspector = inspect(engine)
+    inspector = inspect(get_engine())
     # 3. List all tables in the public schema
     table_names = inspector.get_table_names()
     print("Tables:", table_names)
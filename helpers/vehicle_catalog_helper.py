@@ -0,0 +1,143 @@
+import os
+import re
+import time
+import difflib
+import threading
+from sqlalchemy import func, select
+
+from helpers.database_connector import get_engine
+from helpers.rows_helper import row_dict
+from helpers.schema_helper import vehicles
+
+SPEC_COLUMNS = [
+    "model", "range", "efficiency", "weight", "acceleration", "one_stop_range",
+    "battery", "fastcharge", "towing", "cargo_volume",
+]
+
+VEHICLES_SQL = select(vehicles.c.id, *[vehicles.c[name] for name in SPEC_COLUMNS])
+
+# Changes whenever a vehicle is added or removed
+FINGERPRINT_SQL = select(func.count(), func.max(vehicles.c.id), func.max(vehicles.c.created_at))
+
+
+def model_key(name):
+    # "Tesla Model 3", "tesla model3" and "TESLA-MODEL-3" all become "teslamodel3".
+    # Also matches vehicle models to source PDFs in helpers/hybrid_retriever_helper.py.
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+class VehicleCatalog:
+    """
+    In-memory copy of the `vehicles` table, so spec lookups never touch the database.
+
+    The table is loaded on first use. At most every `refresh_seconds` a one-row fingerprint
+    query checks whether vehicles were added or removed, and the table is reloaded if so;
+    `invalidate()` forces a reload, e.g. after specs were edited in place. An unknown id
+    triggers the same check early, but at most every `miss_refresh_seconds`.
+
+    `find(name)` resolves a free-text model name: an exact match on the normalised name,
+    then names containing it ("model 3" -> "Tesla Model 3" when there is no "Model 3"),
+    then names contained in it, then the closest spelling ("Tesla Modle 3"). Resolved names are memoised until the
+    next reload.
+    """
+
+    def __init__(self, refresh_seconds=60, miss_refresh_seconds=5, cutoff=0.6):
+        self.refresh_seconds = refresh_seconds
+        self.miss_refresh_seconds = miss_refresh_seconds
+        self.cutoff = cutoff
+
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._checked_at = None
+        self._by_id = {}
+        self._ids_by_key = {}
+        self._resolved = {}
+
+        self.reloads = 0
+
+    def _load(self, fingerprint, connection):
+        by_id, ids_by_key = {}, {}
+        for row in connection.execute(VEHICLES_SQL):
+            specs = row_dict(row)
+            vehicle_id = specs.pop("id")
+            by_id[vehicle_id] = specs
+            # Duplicate names resolve to the lowest id, as the table lists them
+            ids_by_key.setdefault(model_key(specs["model"]), vehicle_id)
+        self._by_id, self._ids_by_key, self._resolved = by_id, ids_by_key, {}
+        self._fingerprint = fingerprint
+        self.reloads += 1
+
+    def refresh(self, force=False):
+        """
+        Reload the table if it changed since the last check, or unconditionally with `force`.
+        """
+        with self._lock:
+            with get_engine().connect() as connection:
+                fingerprint = tuple(connection.execute(FINGERPRINT_SQL).one())
+                if force or fingerprint != self._fingerprint:
+                    self._load(fingerprint, connection)
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        self._checked_at = None
+        self._fingerprint = None
+
+    def _checked_within(self, seconds):
+        checked_at = self._checked_at
+        return checked_at is not None and time.monotonic() - checked_at <= seconds
+
+    def _current(self):
+        if not self._checked_within(self.refresh_seconds):
+            self.refresh()
+
+    def get(self, vehicle_id):
+        """
+        Specs of a vehicle by id, or None if there is no such vehicle.
+        """
+        self._current()
+        specs = self._by_id.get(vehicle_id)
+        if specs is None and vehicle_id is not None and not self._checked_within(self.miss_refresh_seconds):
+            # Possibly added since the last check
+            self.refresh()
+            specs = self._by_id.get(vehicle_id)
+        return specs
+
+    def _resolve(self, key):
+        ids_by_key = self._ids_by_key
+        if key in ids_by_key:
+            return ids_by_key[key]
+        containing = [name for name in ids_by_key if key in name]
+        if containing:
+            # The shortest name containing the query is the least specific guess
+            return ids_by_key[min(containing, key=lambda name: (len(name), ids_by_key[name]))]
+        contained = [name for name in ids_by_key if name in key]
+        if contained:
+            # "my tesla model 3 from 2021": the longest name found in the query is the most specific
+            return ids_by_key[max(contained, key=lambda name: (len(name), -ids_by_key[name]))]
+        close = difflib.get_close_matches(key, ids_by_key, n=1, cutoff=self.cutoff)
+        return ids_by_key[close[0]] if close else None
+
+    def find(self, name):
+        """
+        Specs of the vehicle best matching `name`, or None when nothing is close.
+        """
+        self._current()
+        key = model_key(name)
+        if not key:
+            return None
+        resolved = self._resolved
+        if key not in resolved:
+            if len(resolved) >= 4096:
+                resolved.clear()
+            resolved[key] = self._resolve(key)
+        vehicle_id = resolved[key]
+        return self._by_id.get(vehicle_id) if vehicle_id is not None else None
+
+    def stats(self):
+        return {"vehicles": len(self._by_id), "reloads": self.reloads}
+
+
+vehicle_catalog = VehicleCatalog(
+    refresh_seconds=float(os.getenv("VEHICLE_CATALOG_REFRESH_SECONDS", 60)),
+    miss_refresh_seconds=float(os.getenv("VEHICLE_CATALOG_MISS_REFRESH_SECONDS", 5)),
+)
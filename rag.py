@@ -1,44 +1,131 @@
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
 from dotenv import load_dotenv
+import os
+import asyncio
+import threading
 
 from helpers.rag_helper import *
+from helpers.semantic_cache_helper import SemanticCache
 
 load_dotenv()
 
-documents = load_documents()
-create_vectorstore(documents)
-retriever = get_retriever()
+PROMPT = PromptTemplate(
+    input_variables=["context", "question"],
+    template="""
+    You are a helpful assistant. Use the following context to answer the question.
+    If you don't know the answer, say you don't know.
 
+    Context:
+    {context}
 
-def rag(message: str, retriever=retriever):
-    llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0)
+    Question:
+    {question}
+    """
+)
 
-    prompt = PromptTemplate(
-        input_variables=["context", "question"],
-        template="""
-        You are a helpful assistant. Use the following context to answer the question.
-        If you don't know the answer, say you don't know.
 
-        Context:
-        {context}
+class RAGService:
+    """
+    Owns the retriever and the LLM client for knowledge questions.
 
-        Question:
-        {question}
+    One instance is shared by every request, so the retriever's indexes are built once and
+    the LLM client keeps its HTTP connections alive between questions. Both are created on
+    first use, or up front by `warm_up`; `answer` and `aanswer` are safe to call from
+    several threads and tasks.
+
+    The prompt is filled with the `k` chunks the hybrid retriever ranks highest, optionally
+    restricted to the PDFs of one vehicle model.
+    """
+
+    def __init__(self, k=3, fetch_k=20, model="gpt-4o-mini", temperature=0, cache=None):
+        self.k = k
+        self.fetch_k = fetch_k
+        self.model = model
+        self.temperature = temperature
+        self.cache = cache
+        self._retriever = None
+        self._llm = None
+        self._lock = threading.Lock()
+
+    @property
+    def retriever(self):
+        if self._retriever is None:
+            with self._lock:
+                if self._retriever is None:
+                    # Embeds only new or changed PDFs; a no-op when the index is current
+                    build_index()
+                    self._llm = ChatOpenAI(model_name=self.model, temperature=self.temperature)
+                    self._retriever = get_retriever(k=self.k, fetch_k=self.fetch_k)
+        return self._retriever
+
+    def warm_up(self):
+        """
+        Build the vector index, the keyword index and the LLM client now instead of on the first question.
         """
-    )
-
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",  
-        retriever=retriever,
-        return_source_documents=True,
-        chain_type_kwargs={"prompt": prompt},
-    )
-    
-    return qa_chain(message)["result"]
+        self.retriever.search("warm up")
+
+    def _prompt(self, message, vehicle_model):
+        chunks = self.retriever.search(message, vehicle_model=vehicle_model)
+        context = "\n\n".join(chunk.page_content for chunk in chunks)
+        return PROMPT.format(context=context, question=message)
+
+    @staticmethod
+    def _cache_scope(vehicle_model):
+        # Answers scoped to a vehicle are never served for another one
+        return " ".join(vehicle_model.lower().split()) if vehicle_model else None
+
+    def answer(self, message: str, vehicle_model: str = None) -> str:
+        # Repeated and near-identical questions are answered from the cache, with no LLM call
+        version = corpus_version()
+        scope = self._cache_scope(vehicle_model)
+        if self.cache:
+            answer, vector = self.cache.get(message, version, scope)
+            if answer is not None:
+                return answer
+
+        prompt = self._prompt(message, vehicle_model)
+        answer = self._llm.invoke(prompt).content
+        if self.cache:
+            self.cache.put(message, answer, version, vector, scope)
+        return answer
+
+    async def aanswer(self, message: str, vehicle_model: str = None) -> str:
+        version = corpus_version()
+        scope = self._cache_scope(vehicle_model)
+        if self.cache:
+            # The similarity lookup may embed the question, which is a blocking call
+            answer, vector = await asyncio.to_thread(self.cache.get, message, version, scope)
+            if answer is not None:
+                return answer
+
+        prompt = await asyncio.to_thread(self._prompt, message, vehicle_model)
+        answer = (await self._llm.ainvoke(prompt)).content
+        if self.cache:
+            await asyncio.to_thread(self.cache.put, message, answer, version, vector, scope)
+        return answer
+
+
+answer_cache = SemanticCache(
+    embed=lambda text: get_embeddings().embed_query(text),
+    threshold=float(os.getenv("RAG_CACHE_THRESHOLD", 0.95)),
+    ttl_seconds=int(os.getenv("RAG_CACHE_TTL_SECONDS", 24 * 3600)),
+    max_entries=int(os.getenv("RAG_CACHE_MAX_ENTRIES", 2048)),
+)
+
+rag_service = RAGService(
+    k=int(os.getenv("RAG_TOP_K", 3)),
+    fetch_k=int(os.getenv("RAG_FETCH_K", 20)),
+    model=os.getenv("RAG_MODEL", "gpt-4o-mini"),
+    temperature=float(os.getenv("RAG_TEMPERATURE", 0)),
+    cache=answer_cache,
+)
+
+
+def rag(message: str, vehicle_model: str = None) -> str:
+    return rag_service.answer(message, vehicle_model)
+
 
 if __name__ == "__main__":
     message = "tell me about the charging types and connectors"
-    print(rag(message))
\ No newline at end of file
+    print(rag(message))
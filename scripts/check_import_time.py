@@ -0,0 +1,82 @@
+"""
+Check that importing the web app stays fast and free of heavy side effects.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter, prints the slowest
+imports, and exits non-zero if:
+
+  * the cumulative import time of `app` exceeds --budget-ms, or
+  * a module that must load lazily (the RAG stack, pandas, numpy) was imported, or
+  * importing created a database file (an engine was opened at import time).
+
+Usage:
+    python -m scripts.check_import_time --budget-ms 2500
+"""
+import os
+import sys
+import argparse
+import subprocess
+import tempfile
+
+# Loaded on first use or by the FastAPI lifespan hook, never while importing the app
+LAZY_MODULES = ["rag", "langchain", "langchain_openai", "langchain_community", "chromadb", "pypdf", "pandas", "numpy"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_imports(module):
+    """
+    {module name: (self_us, cumulative_us)} for every module imported by `import module`.
+    """
+    with tempfile.TemporaryDirectory() as cwd:
+        env = {**os.environ, "PYTHONPATH": ROOT, "PYTHONDONTWRITEBYTECODE": "1"}
+        # The OpenAI clients are created at import and only need some key to exist
+        env.setdefault("OPENAI_API_KEY", "import-time-check")
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=cwd, env=env, capture_output=True, text=True,
+        )
+        created = os.listdir(cwd)
+
+    if process.returncode != 0:
+        sys.exit(f"import {module} failed:\n{process.stderr[-2000:]}")
+
+    timings = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings, created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=2500)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    timings, created = measure_imports(args.module)
+    total_ms = timings[args.module][1] / 1000
+
+    print("Slowest imports (cumulative ms):")
+    for name, (_, cumulative_us) in sorted(timings.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"  {cumulative_us / 1000:>9.1f}  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import {args.module} took {total_ms:.0f} ms, budget is {args.budget_ms:.0f} ms")
+    eager = sorted(name for name in LAZY_MODULES if name in timings)
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    if created:
+        failures.append(f"files created at import: {', '.join(created)}")
+
+    print(f"\nimport {args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
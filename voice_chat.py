@@ -1,19 +1,63 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import io
 import os
+import re
+import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
 
 api_key = os.getenv("OPENAI_API_KEY")
 client = OpenAI(api_key=api_key)
+async_client = AsyncOpenAI(api_key=api_key)
 
-def stt(filepath: str) -> str:
-    with open(filepath, "rb") as audio_file:
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            response_format="text"  # You can use 'json' or 'verbose_json' too
-        )
+# Whisper rejects uploads above 25 MB
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_BYTES", 25 * 1024 * 1024))
+
+# End of a sentence: terminal punctuation followed by whitespace, or a line break
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+# Sentences shorter than this are merged with the next one to save TTS round-trips
+MIN_SENTENCE_CHARS = 40
+
+# Markdown the model uses for formatting, which should not be read out
+MARKDOWN_NOISE = re.compile(r"[#*_`|>]+")
+
+def audio_upload(audio, filename: str = "audio.wav"):
+    """
+    Prepare WAV audio for the transcription API from bytes or a seekable file-like object
+    (such as an upload's spooled file), without copying it.
+
+    Only the first 12 bytes are read: oversized and non-WAV input is rejected with a
+    `ValueError` before anything is sent.
+    """
+    if isinstance(audio, (bytes, bytearray)):
+        audio = io.BytesIO(audio)
+
+    size = audio.seek(0, os.SEEK_END)
+    if size > MAX_AUDIO_BYTES:
+        raise ValueError(f"Audio is larger than {MAX_AUDIO_BYTES // (1024 * 1024)} MB")
+
+    audio.seek(0)
+    header = audio.read(12)
+    audio.seek(0)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise ValueError("Audio is not a valid WAV file")
+
+    return (filename, audio)
+
+
+def stt(audio, filename: str = "audio.wav") -> str:
+    # `audio` is a file path, bytes or a file-like object
+    if isinstance(audio, str):
+        with open(audio, "rb") as audio_file:
+            return stt(audio_file, os.path.basename(audio))
+
+    transcript = client.audio.transcriptions.create(
+        model="whisper-1",
+        file=audio_upload(audio, filename),
+        response_format="text"  # You can use 'json' or 'verbose_json' too
+    )
     return transcript
 
 
@@ -24,14 +68,120 @@ def tts(text: str, voice: str = "alloy", isDeployed: bool = False):
         voice=voice,
         input=text
     )
-    
+    audio_data = response.read()
+
     if not isDeployed:
         with open("output.mp3", "wb") as f:
-            f.write(response.read())
-        
-    return response.read()
+            f.write(audio_data)
+
+    return audio_data
+
+
+async def astt(audio, filename: str = "audio.wav") -> str:
+    if isinstance(audio, str):
+        with open(audio, "rb") as audio_file:
+            return await astt(audio_file, os.path.basename(audio))
+
+    transcript = await async_client.audio.transcriptions.create(
+        model="whisper-1",
+        file=audio_upload(audio, filename),
+        response_format="text"
+    )
+    return transcript
+
+
+async def atts(text: str, voice: str = "alloy", isDeployed: bool = False):
+    response = await async_client.audio.speech.create(
+        model="tts-1",
+        voice=voice,
+        input=text
+    )
+    audio_data = response.content
+
+    if not isDeployed:
+        with open("output.mp3", "wb") as f:
+            f.write(audio_data)
+
+    return audio_data
+
+
+async def split_sentences(text_deltas):
+    """
+    Regroup streamed text deltas into sentences, yielding each one as soon as it is complete.
+    """
+    buffer = ""
+    async for delta in text_deltas:
+        buffer += delta
+        while True:
+            match = SENTENCE_END.search(buffer, MIN_SENTENCE_CHARS)
+            if not match:
+                break
+            sentence, buffer = buffer[:match.start()], buffer[match.end():]
+            if sentence.strip():
+                yield sentence.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+async def atts_stream(text: str, voice: str = "alloy"):
+    """
+    Synthesise `text` and yield the MP3 bytes as they arrive, without buffering the whole clip.
+    """
+    async with async_client.audio.speech.with_streaming_response.create(
+        model="tts-1",
+        voice=voice,
+        input=text,
+        response_format="mp3",
+    ) as response:
+        async for chunk in response.iter_bytes():
+            yield chunk
+
+
+# Collectors left to finish the reply after the listener went away
+draining = set()
+
+async def speak_stream(text_deltas, voice: str = "alloy"):
+    """
+    Turn a stream of text deltas into a stream of MP3 audio.
+
+    Sentences are collected in the background while earlier ones are being synthesised,
+    so the first sentence plays while the model is still writing the rest. MP3 frames
+    concatenate cleanly, so the per-sentence clips form one playable stream.
+
+    If the listener disconnects, only the speech stops: the text stream is still read to
+    the end, so the reply is finished and saved like any other turn.
+    """
+    sentences = asyncio.Queue()
+    listening = True
+
+    async def collect():
+        try:
+            async for sentence in split_sentences(text_deltas):
+                spoken = MARKDOWN_NOISE.sub("", sentence).strip()
+                if spoken and listening:
+                    await sentences.put(spoken)
+        finally:
+            await sentences.put(None)
+
+    def finished(task):
+        draining.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(task.exception())
+
+    collector = asyncio.create_task(collect())
+    try:
+        while (sentence := await sentences.get()) is not None:
+            async for chunk in atts_stream(sentence, voice):
+                yield chunk
+        # Surface errors raised while producing the text
+        await collector
+    finally:
+        if not collector.done():
+            listening = False
+            draining.add(collector)
+            collector.add_done_callback(finished)
 
 
 if __name__ == "__main__":
     text = stt("input.wav")
-    tts(text, "nova")
\ No newline at end of file
+    tts(text, "nova")